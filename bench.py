@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the scan -> parse -> emit hot paths, on synthetic trees.
+- Builds throwaway trees of empty files (1k/10k/100k by default): nested folders,
+  a mix of YYYY-MM-DD / YYYY_MM_DD / non-matching stems, and bursts of
+  same-second captures for the rename planner.
+- Times each stage (best of --repeat). scan/sort/parse are the building blocks;
+  emit and plan are the entry points users actually run, end to end:
+    scan        collect_files() of gallery_entries.py (used by every entry generator),
+                iter_files() of rename_script.py  (rglob + is_file)
+    sort        natural_key() sort of all names
+    parse       parse_day_from_stem() over all stems
+    emit        create_entries.py's default path (merge_entries.emit_by_filename()) and
+                merge_entries.run() in capture order, both writing --out
+    plan        rename_script.plan_renames() for the tree, in same-second bursts
+- Writes JSON results; with --baseline, compares items/s against a previous run
+  and exits 1 if any stage got slower than --tolerance.
+
+Usage:
+  python3 bench.py --out bench.json
+  python3 bench.py --sizes 1000 10000 100000 --baseline bench.json --tolerance 0.15
+"""
+
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+import gallery_entries
+import merge_entries
+import rename_script
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_BURST = 50  # shots per second in the rename-planner burst case
+
+def make_tree(root: Path, n: int, seed: int = 1) -> List[Path]:
+    """n empty files spread over year/month folders up to 3 levels deep."""
+    rnd = random.Random(seed)
+    start = datetime(2019, 1, 1)
+    paths = []
+    for i in range(n):
+        dt = start + timedelta(seconds=rnd.randrange(7 * 365 * 86400))
+        kind = i % 10
+        if kind < 6:
+            stem = dt.strftime("%Y-%m-%d_%H%M%S")
+        elif kind < 8:
+            stem = dt.strftime("%Y_%m_%d") + f"_{i % 7 + 1}"
+        elif kind < 9:
+            stem = f"IMG_{i:05d}"  # non-matching
+        else:
+            stem = dt.strftime("%Y-%m-%d") + f"({i % 3})"
+        depth = i % 4
+        folder = root
+        if depth >= 1:
+            folder = folder / f"{dt.year}"
+        if depth >= 2:
+            folder = folder / f"{dt.month:02d}"
+        if depth >= 3:
+            folder = folder / "extra"
+        ext = ".jpg" if i % 5 else ".jpeg"
+        paths.append(folder / f"{stem}-{i}{ext}")
+    for p in paths:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.touch()
+    return paths
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def entry_args(out: Path) -> argparse.Namespace:
+    """The generators' CLI defaults, minus the caches in ~/.cache (empty files have no EXIF or pixels)."""
+    ap = argparse.ArgumentParser()
+    merge_entries.add_output_args(ap)
+    args = ap.parse_args(["-r", "--no-cache", "--no-meta", "--out", str(out)])
+    args.sender, args.symbol, args.skip_nonmatching = "Bench", "B", True
+    return args
+
+def quiet(fn: Callable[[], object]) -> Callable[[], object]:
+    """fn with its status lines swallowed, so they don't end up in the timings' output."""
+    def call():
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            return fn()
+    return call
+
+def burst_times(files: List[Path], burst: int) -> List[tuple]:
+    """(path, capture dt) with `burst` consecutive files sharing each second."""
+    base = datetime(2024, 4, 25, 12, 0, 0)
+    return [(p, base + timedelta(seconds=i // burst)) for i, p in enumerate(files)]
+
+def run_size(n: int, repeat: int, burst: int) -> List[dict]:
+    results = []
+
+    def record(stage: str, seconds: float, items: int):
+        results.append({"stage": stage, "size": n, "items": items, "seconds": round(seconds, 6),
+                        "items_per_s": round(items / seconds, 1) if seconds else None})
+        print(f"  {stage:<28} {seconds * 1000:10.2f} ms  {items / seconds if seconds else 0:14,.0f} items/s")
+
+    with tempfile.TemporaryDirectory(prefix="piccolamimi-bench-") as tmp:
+        root = Path(tmp)
+        make_tree(root, n)
+        exts = list(gallery_entries.DEFAULT_EXTS)
+
+        record("scan.collect_files", best_of(lambda: gallery_entries.collect_files(root, True, exts), repeat), n)
+        record("scan.rename_iter_files", best_of(lambda: list(rename_script.iter_files(root, True)), repeat), n)
+
+        files = gallery_entries.collect_files(root, True, exts)
+        names = [p.name for p in files]
+        rels = [p.relative_to(root).as_posix() for p in files]
+        record("sort.natural_key.name", best_of(lambda: sorted(names, key=gallery_entries.natural_key), repeat), n)
+        record("sort.natural_key.relpath", best_of(lambda: sorted(rels, key=gallery_entries.natural_key), repeat), n)
+
+        stems = [p.stem for p in files]
+        def parse_all(parse=gallery_entries.parse_day_from_stem):
+            for s in stems:
+                try:
+                    parse(s)
+                except ValueError:
+                    pass
+        record("parse.parse_day_from_stem", best_of(parse_all, repeat), n)
+
+        groups, _skipped = gallery_entries.group_by_day(files)
+        count = sum(len(v) for v in groups.values())
+        args = entry_args(Path(tmp) / "entries.html")
+        record("emit.create_entries", best_of(quiet(lambda: merge_entries.emit_by_filename(args, root)), repeat), count)
+        source = [merge_entries.Source(root, args.sender, args.symbol)]
+        record("emit.merge_entries.run", best_of(quiet(lambda: merge_entries.run(args, source, root)), repeat), count)
+
+        resolved = burst_times(sorted(rename_script.iter_files(root, True)), burst)
+        record(f"plan.plan_renames.burst{burst}",
+               best_of(lambda: rename_script.plan_renames(resolved, "%Y-%m-%d_%H%M%S"), repeat), n)
+    return results
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Stages whose items/s dropped by more than tolerance vs the baseline."""
+    base = {(r["stage"], r["size"]): r for r in baseline}
+    slower = []
+    for r in results:
+        b = base.get((r["stage"], r["size"]))
+        if not b or not b.get("items_per_s") or not r.get("items_per_s"):
+            continue
+        ratio = r["items_per_s"] / b["items_per_s"]
+        r["vs_baseline"] = round(ratio, 3)
+        if ratio < 1 - tolerance:
+            slower.append(f"{r['stage']} @ {r['size']}: {ratio:.2f}x of baseline")
+    return slower
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark scan/parse/emit/plan stages on synthetic trees.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                    help="Tree sizes in files (default: 1000 10000 100000)")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per stage, best is kept (default: 3)")
+    ap.add_argument("--burst", type=int, default=DEFAULT_BURST, help="Same-second shots per burst (default: 50)")
+    ap.add_argument("--out", default="", help="Write JSON results here")
+    ap.add_argument("--baseline", default="", help="Previous JSON results to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15,
+                    help="Allowed items/s drop vs baseline before failing (default: 0.15)")
+    args = ap.parse_args()
+
+    results = []
+    for n in args.sizes:
+        print(f"{n} files")
+        results.extend(run_size(n, args.repeat, args.burst))
+
+    slower = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        slower = compare(results, baseline["results"], args.tolerance)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nWrote {args.out}")
+    if slower:
+        print("\nSlower than baseline:")
+        for line in slower:
+            print(f"  {line}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
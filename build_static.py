@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Production build of the gallery into a static output dir (default: ./dist).
+- foto/ and derivatives/ are copied with a content hash in the filename
+  (foto/2024-04-25_1.3f9c2a7b1e.jpg), and every src/srcset in index.html (the #data
+  sections included) and in the manifest shards is rewritten to match. A changed
+  photo gets a new URL, so all of them can be cached forever.
+- index.html and manifest/*.json keep their names (the page builds shard URLs
+  itself) and get precompressed .gz siblings, plus .br when the brotli module is
+  installed.
+- atlas/ (make_atlas.py) is copied as is: its images already carry a content hash,
+  its month maps are small JSON like the shards.
+- asset-manifest.json lists the immutable paths and the original -> hashed names.
+- Incremental: a state file remembers size/mtime/hash per source, so unchanged
+  photos are neither re-hashed nor re-copied, and outputs that are no longer
+  produced are removed.
+
+nginx:
+  location ~ "\\.[0-9a-f]{10}\\.(jpe?g|png|webp)$" { add_header Cache-Control "public, max-age=31536000, immutable"; }
+  location / { gzip_static on; brotli_static on; add_header Cache-Control "no-cache"; }
+
+Usage:
+  python3 build_static.py --out ./dist
+  python3 build_static.py --src . --out ./dist --dirs foto derivatives --dry-run
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Set
+
+from gallery_io import atomic_write_bytes, atomic_write_text
+
+try:  # .br siblings are optional
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_LEN = 10
+STATE_NAME = ".build-state.json"
+ASSET_MANIFEST = "asset-manifest.json"
+DEFAULT_DIRS = ("foto", "derivatives")
+COMPRESS_MIN = 512  # bytes; smaller text files aren't worth a sibling
+CHUNK = 1 << 20
+
+HASHED_RE = re.compile(r"\.[0-9a-f]{%d}\.[^./]+$" % HASH_LEN)
+URL_ATTR_RE = re.compile(r'\b(src|srcset|href)="([^"]*)"')
+
+def file_hash(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()[:HASH_LEN]
+
+def hashed_name(rel: str, digest: str) -> str:
+    p = PurePosixPath(rel)
+    return str(p.with_name(f"{p.stem}.{digest}{p.suffix}"))
+
+def copy_atomic(src: Path, dst: Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{dst.name}.", suffix=".tmp", dir=str(dst.parent))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        shutil.copymode(src, tmp)  # mkstemp's 0600 would make dist/ unreadable to the web server
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def build_assets(src_root: Path, out_root: Path, dirs: List[str], state: dict, dry: bool) -> Dict[str, str]:
+    """Copy every file under dirs to its hashed name. Returns rel -> hashed rel."""
+    known = state.setdefault("files", {})
+    mapping: Dict[str, str] = {}
+    seen: Set[str] = set()
+    copied = reused = 0
+    for d in dirs:
+        base = src_root / d
+        if not base.is_dir():
+            continue
+        for p in sorted(base.rglob("*")):
+            if not p.is_file() or p.name.startswith("."):
+                continue
+            rel = p.relative_to(src_root).as_posix()
+            st = p.stat()
+            prev = known.get(rel)
+            if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                digest = prev["hash"]
+            else:
+                digest = file_hash(p)
+                known[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+            out_rel = hashed_name(rel, digest)
+            mapping[rel] = out_rel
+            seen.add(rel)
+            if (out_root / out_rel).exists():
+                reused += 1
+                continue
+            copied += 1
+            if dry:
+                print(f"[DRY] {rel} -> {out_rel}")
+            else:
+                copy_atomic(p, out_root / out_rel)
+    for rel in set(known) - seen:
+        del known[rel]
+    print(f"Assets: {copied} copied, {reused} unchanged.")
+    return mapping
+
+def rewrite_url(url: str, mapping: Dict[str, str]) -> str:
+    lead = "./" if url.startswith("./") else ""
+    key = url[len(lead):]
+    return lead + mapping[key] if key in mapping else url
+
+def rewrite_srcset(value: str, mapping: Dict[str, str]) -> str:
+    parts = []
+    for part in value.split(","):
+        bits = part.strip().split(None, 1)
+        if bits:
+            bits[0] = rewrite_url(bits[0], mapping)
+            parts.append(" ".join(bits))
+    return ", ".join(parts)
+
+def rewrite_html(text: str, mapping: Dict[str, str]) -> str:
+    def sub(m):
+        attr, value = m.group(1), m.group(2)
+        new = rewrite_srcset(value, mapping) if attr == "srcset" else rewrite_url(value, mapping)
+        return f'{attr}="{new}"'
+    return URL_ATTR_RE.sub(sub, text)
+
+def rewrite_shard(shard: dict, mapping: Dict[str, str]) -> dict:
+    for entries in shard.values():
+        for e in entries:
+            e["src"] = rewrite_url(e["src"], mapping)
+            if e.get("srcset"):
+                e["srcset"] = rewrite_srcset(e["srcset"], mapping)
+    return shard
+
+def emit_text(out_root: Path, rel: str, data: bytes, dry: bool) -> List[str]:
+    """Write a text asset plus .gz/.br siblings, only if its content changed. Returns rels produced."""
+    dst = out_root / rel
+    produced = [rel]
+    siblings = []
+    if len(data) >= COMPRESS_MIN:
+        siblings.append((rel + ".gz", lambda: gzip.compress(data, 9, mtime=0)))
+        if brotli is not None:
+            siblings.append((rel + ".br", lambda: brotli.compress(data, quality=11)))
+    produced += [name for name, _ in siblings]
+
+    unchanged = dst.is_file() and dst.read_bytes() == data and all((out_root / n).is_file() for n, _ in siblings)
+    if unchanged:
+        return produced
+    if dry:
+        print(f"[DRY] write {rel}" + "".join(f" +{Path(n).suffix}" for n, _ in siblings))
+        return produced
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_bytes(dst, data)
+    for name, make in siblings:
+        atomic_write_bytes(out_root / name, make())
+    print(f"Wrote {rel}" + "".join(f" +{Path(n).suffix}" for n, _ in siblings))
+    return produced
+
+def prune(out_root: Path, old: Set[str], current: Set[str], dry: bool) -> int:
+    removed = 0
+    for rel in sorted(old - current):
+        p = out_root / rel
+        if p.is_file():
+            removed += 1
+            if dry:
+                print(f"[DRY] remove {rel}")
+            else:
+                p.unlink()
+    return removed
+
+def main():
+    ap = argparse.ArgumentParser(description="Build a content-hashed, precompressed static copy of the gallery.")
+    ap.add_argument("--src", default=".", help="Gallery root with index.html (default: .)")
+    ap.add_argument("--out", default="./dist", help="Output directory (default: ./dist)")
+    ap.add_argument("--dirs", nargs="+", default=list(DEFAULT_DIRS),
+                    help="Asset dirs to hash, relative to --src (default: foto derivatives)")
+    ap.add_argument("--manifest-dir", default="manifest", help="Manifest dir relative to --src (default: manifest)")
+    ap.add_argument("--atlas-dir", default="atlas", help="Sprite atlas dir relative to --src (default: atlas)")
+    ap.add_argument("--dry-run", action="store_true", help="Show what would be written")
+    args = ap.parse_args()
+
+    src_root = Path(args.src).expanduser().resolve()
+    out_root = Path(args.out).expanduser().resolve()
+    if not (src_root / "index.html").is_file():
+        raise SystemExit(f"No index.html in {src_root}")
+    if out_root == src_root or any(out_root == src_root / d for d in args.dirs):
+        raise SystemExit("--out must not be the gallery itself or one of its asset dirs.")
+    if not args.dry_run:
+        out_root.mkdir(parents=True, exist_ok=True)
+
+    state_path = out_root / STATE_NAME
+    try:
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        state = {}
+    old_outputs = set(state.get("outputs", []))
+
+    mapping = build_assets(src_root, out_root, args.dirs, state, args.dry_run)
+    outputs = set(mapping.values())
+
+    html_text = (src_root / "index.html").read_text(encoding="utf-8")
+    outputs.update(emit_text(out_root, "index.html", rewrite_html(html_text, mapping).encode("utf-8"), args.dry_run))
+
+    manifest_dir = src_root / args.manifest_dir
+    if manifest_dir.is_dir():
+        for p in sorted(manifest_dir.glob("*.json")):
+            obj = json.loads(p.read_text(encoding="utf-8"))
+            if p.name != "index.json":
+                obj = rewrite_shard(obj, mapping)
+            data = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+            outputs.update(emit_text(out_root, f"{args.manifest_dir}/{p.name}", data, args.dry_run))
+
+    immutable = sorted(mapping.values())
+    atlas_dir = src_root / args.atlas_dir
+    if atlas_dir.is_dir():
+        for p in sorted(atlas_dir.iterdir()):
+            rel = f"{args.atlas_dir}/{p.name}"
+            if p.suffix == ".json":
+                outputs.update(emit_text(out_root, rel, p.read_bytes(), args.dry_run))
+            elif HASHED_RE.search(p.name):
+                outputs.add(rel)
+                immutable.append(rel)
+                if not (out_root / rel).exists():
+                    if args.dry_run:
+                        print(f"[DRY] {rel}")
+                    else:
+                        copy_atomic(p, out_root / rel)
+        immutable.sort()
+    asset_manifest = json.dumps({"immutable": immutable, "assets": dict(sorted(mapping.items()))},
+                                ensure_ascii=False, indent=1)
+    outputs.add(ASSET_MANIFEST)
+    removed = prune(out_root, old_outputs, outputs, args.dry_run)
+
+    if args.dry_run:
+        print(f"\n[DRY] {len(immutable)} immutable asset(s), {removed} stale output(s) would be removed.")
+        return
+    atomic_write_text(out_root / ASSET_MANIFEST, asset_manifest)
+    state["outputs"] = sorted(outputs)
+    atomic_write_text(state_path, json.dumps(state, indent=1))
+    print(f"\nBuilt {out_root}: {len(immutable)} immutable asset(s), {removed} stale output(s) removed."
+          + ("" if brotli else " (brotli not installed: .gz only)"))
+
+if __name__ == "__main__":
+    main()
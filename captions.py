@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Caption store behind /api/captions (mounted by server.py).
+- Captions are keyed by the photo's path ("foto/2024-04-25_1.jpg"), not by its
+  position in the day, so reordering figures doesn't move captions around.
+  build_static.py's hashed names ("...25_1.3f9c2a7b1e.jpg") map back to the same key.
+- Every edit is appended to data/captions.log. Bursts of blur-triggered saves are
+  coalesced: edits arriving within FLUSH_DELAY share one write + fsync, and each
+  request is answered only once its edit is on disk.
+- The log is folded into the data/captions.json snapshot (atomic rewrite) every
+  COMPACT_EVERY records and on shutdown; startup = snapshot + log replay.
+- GET ?month=YYYY-MM returns a whole month's captions in one response.
+
+API:
+  GET /api/captions?month=2024-04  -> {"foto/2024-04-25_1.jpg": "testo", ...}
+  PUT /api/captions  {"src": "./foto/2024-04-25_1.jpg", "date": "2024-04-25", "text": "..."}
+
+Usage:
+  python3 server.py --data ./data
+  python3 captions.py --data ./data --compact        # fold the log offline
+  python3 captions.py --data ./data --month 2024-04  # print one month
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from gallery_io import atomic_write_text
+from gallery_http import GalleryServer, HttpError, Request, send_bytes
+
+SNAPSHOT_NAME = "captions.json"
+LOG_NAME = "captions.log"
+FLUSH_DELAY = 0.05     # seconds to wait for more edits before the fsync
+COMPACT_EVERY = 1000   # log records
+MAX_CAPTION = 2000     # characters
+HASHED_SUFFIX_RE = re.compile(r"\.[0-9a-f]{10}(\.[^./]+)$")
+DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+def caption_key(src: str) -> str:
+    """'./foto/a.jpg', '/foto/a.jpg' and 'foto/a.3f9c2a7b1e.jpg' are all 'foto/a.jpg'."""
+    path = unquote(urlsplit(src).path).lstrip("/")
+    while path.startswith("./"):
+        path = path[2:]
+    return HASHED_SUFFIX_RE.sub(r"\1", path)
+
+class CaptionStore:
+    def __init__(self, data_dir: Path):
+        data_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = data_dir / SNAPSHOT_NAME
+        self.log_path = data_dir / LOG_NAME
+        self.captions: Dict[str, dict] = {}  # key -> {"day", "text", "ts"}
+        self.by_month: Dict[str, set] = defaultdict(set)
+        self.log_records = 0
+        self._load()
+        self.log = open(self.log_path, "a", encoding="utf-8")
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+        self.flush_task = None
+        self.io_lock = None  # created on the serving loop
+
+    def _apply(self, key: str, day: str, text: str, ts: float):
+        old = self.captions.get(key)
+        if old:
+            self.by_month[old["day"][:7]].discard(key)
+        self.captions[key] = {"day": day, "text": text, "ts": ts}
+        self.by_month[day[:7]].add(key)
+
+    def _load(self):
+        try:
+            snap = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            snap = {}
+        for key, v in snap.get("captions", {}).items():
+            self._apply(key, v["day"], v["text"], v.get("ts", 0))
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn tail from a crash mid-write
+                self._apply(rec["k"], rec["d"], rec["t"], rec["ts"])
+                self.log_records += 1
+
+    def month(self, month: str) -> Dict[str, str]:
+        return {k: self.captions[k]["text"] for k in sorted(self.by_month.get(month, ()))}
+
+    async def put(self, src: str, day: str, text: str):
+        """Record an edit; returns once it has been fsynced."""
+        key, ts = caption_key(src), round(time.time(), 3)
+        self._apply(key, day, text, ts)  # visible to readers right away
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append((json.dumps({"k": key, "d": day, "t": text, "ts": ts}, ensure_ascii=False) + "\n", fut))
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self._flush_soon())
+        await fut
+
+    async def _flush_soon(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(FLUSH_DELAY)
+        if self.io_lock is None:
+            self.io_lock = asyncio.Lock()
+        async with self.io_lock:
+            batch, self.pending, self.flush_task = self.pending, [], None
+            try:
+                await loop.run_in_executor(None, self._write, "".join(line for line, _ in batch))
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_result(None)
+            self.log_records += len(batch)
+            if self.log_records >= COMPACT_EVERY:
+                # Serialise on this thread: put() keeps changing self.captions while the executor writes
+                text = self.snapshot_text()
+                try:
+                    await loop.run_in_executor(None, self.compact, text)
+                except Exception as e:
+                    print(f"ERROR: caption compaction failed: {e}", file=sys.stderr)
+
+    def _write(self, data: str):
+        self.log.write(data)
+        self.log.flush()
+        os.fsync(self.log.fileno())
+
+    def snapshot_text(self) -> str:
+        return json.dumps({"v": 1, "captions": self.captions}, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def compact(self, text: Optional[str] = None):
+        """
+        Snapshot first, then empty the log: replaying a log over a newer snapshot is harmless.
+        Off the loop thread, pass a snapshot_text() taken on it.
+        """
+        atomic_write_text(self.snapshot_path, self.snapshot_text() if text is None else text)
+        self.log.truncate(0)
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.log_records = 0
+
+    def close(self):
+        if self.pending:
+            self._write("".join(line for line, _ in self.pending))
+            self.pending = []
+        if self.log_records:
+            self.compact()
+        self.log.close()
+
+def mount(server: GalleryServer, store: CaptionStore, prefix: str = "/api/captions"):
+    async def handle(req: Request, writer: asyncio.StreamWriter):
+        headers = [("Cache-Control", "no-store")]
+        if req.method in ("GET", "HEAD"):
+            month = (req.query.get("month") or [""])[0]
+            if not MONTH_RE.match(month):
+                raise HttpError(400, "month=YYYY-MM required")
+            body = json.dumps(store.month(month), ensure_ascii=False).encode("utf-8")
+            await send_bytes(writer, 200, body, "application/json; charset=utf-8", headers, req.method == "HEAD")
+            return
+        if req.method in ("PUT", "POST"):
+            try:
+                data = json.loads(req.body)
+                src, day, text = data["src"], data["date"], str(data.get("text", ""))
+            except (ValueError, KeyError, TypeError):
+                raise HttpError(400, "expected JSON {src, date, text}")
+            if not isinstance(src, str) or not caption_key(src) or not DAY_RE.match(str(day)):
+                raise HttpError(400, "bad src or date")
+            if len(text) > MAX_CAPTION:
+                raise HttpError(413)
+            await store.put(src, day, text)
+            await send_bytes(writer, 200, b'{"ok":true}', "application/json; charset=utf-8", headers)
+            return
+        raise HttpError(405)
+
+    server.route(prefix, handle)
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or compact the caption store used by server.py.")
+    ap.add_argument("--data", default="./data", help="Data directory (default: ./data)")
+    ap.add_argument("--compact", action="store_true", help="Fold captions.log into captions.json")
+    ap.add_argument("--month", help="Print the captions of one month (YYYY-MM)")
+    args = ap.parse_args()
+
+    store = CaptionStore(Path(args.data).expanduser())
+    if args.month:
+        print(json.dumps(store.month(args.month), ensure_ascii=False, indent=1))
+    pending = store.log_records
+    if args.compact:
+        store.compact()
+        print(f"Compacted {pending} log record(s); {len(store.captions)} caption(s) in {store.snapshot_path}")
+    store.log.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Find exact and near-duplicate photos with a persistent hash index.
+- Per image: a content hash (blake2b of the bytes) and a 64-bit dHash computed from a
+  reduced decode (JPEG draft mode, EXIF-rotated, 9x8 grayscale), stored in SQLite keyed by
+  path/size/mtime so re-runs only hash new or changed files.
+- Near-duplicates (re-exports, chat-app recompression) are found with a BK-tree over
+  the dHashes, so a check costs ~log(n) comparisons instead of all pairs.
+- --check compares incoming files against the index without adding them, so an
+  import can be screened before rename_script.py / create_entries.py picks it up.
+
+Usage:
+  python3 dedup.py ./foto -r
+  python3 dedup.py ./foto -r --check ~/Downloads/inbox/*.jpg --threshold 6
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+try:  # HEIC support is optional here
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pass
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".heic"}
+DEFAULT_INDEX = Path.home() / ".cache" / "piccolamimi" / "dedup.sqlite"
+DEFAULT_THRESHOLD = 6  # max differing dHash bits to call two photos near-duplicates
+SCHEMA_VERSION = 2  # 2: dHash of the EXIF-rotated image
+CHUNK = 1 << 20
+
+def content_hash(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def dhash(path: Path) -> int:
+    """Difference hash: compare horizontally adjacent pixels of a 9x8 grayscale thumbnail."""
+    with Image.open(path) as im:
+        im.draft("L", (64, 64))  # JPEG: decode at 1/8 scale, never the full image
+        # As displayed: a chat re-export with the rotation baked in must match its original
+        small = ImageOps.exif_transpose(im).convert("L").resize((9, 8), Image.BILINEAR)
+        px = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            i = row * 9 + col
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return bits
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Burkhard-Keller tree over ints with Hamming distance."""
+
+    def __init__(self):
+        self.root = None  # [value, items, {distance: child}]
+
+    def add(self, value: int, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> Iterator[Tuple[int, object]]:
+        """Yield (distance, item) for every item within radius of value."""
+        if self.root is None:
+            return
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                for item in node[1]:
+                    yield d, item
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:
+                    stack.append(child)
+
+class HashIndex:
+    """SQLite table of (path, size, mtime) -> (content hash, dHash)."""
+
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " chash TEXT NOT NULL, dhash TEXT NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS images_chash ON images (chash)")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute("DELETE FROM images")  # dHashes from an older version don't compare
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.db.commit()
+
+    def hashes(self, path: Path, store: bool = True) -> Tuple[str, int]:
+        st = path.stat()
+        row = self.db.execute(
+            "SELECT chash, dhash FROM images WHERE path=? AND size=? AND mtime_ns=?",
+            (str(path), st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if row:
+            return row[0], int(row[1], 16)
+        chash, dh = content_hash(path), dhash(path)
+        if store:
+            self.db.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+                (str(path), st.st_size, st.st_mtime_ns, chash, f"{dh:016x}"),
+            )
+        return chash, dh
+
+    def prune(self, root: Path, seen: set, recursive: bool = True) -> int:
+        """Drop rows for files the scan should have seen but didn't: under root, or directly in it."""
+        prefix = str(root).rstrip("/") + "/"
+        gone = [(p,) for (p,) in self.db.execute(
+            "SELECT path FROM images WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+            if p not in seen and (recursive or "/" not in p[len(prefix):])]
+        self.db.executemany("DELETE FROM images WHERE path=?", gone)
+        return len(gone)
+
+    def rows(self) -> Iterator[Tuple[str, str, int]]:
+        for path, chash, dh in self.db.execute("SELECT path, chash, dhash FROM images"):
+            yield path, chash, int(dh, 16)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def build_tree(index: HashIndex, root: Optional[Path] = None) -> Tuple[BKTree, Dict[str, List[str]]]:
+    tree, by_chash = BKTree(), defaultdict(list)
+    prefix = str(root).rstrip("/") + "/" if root else ""
+    for path, chash, dh in index.rows():
+        if path.startswith(prefix):
+            tree.add(dh, path)
+            by_chash[chash].append(path)
+    return tree, by_chash
+
+def near_groups(tree: BKTree, items: List[Tuple[str, int]], threshold: int) -> List[List[str]]:
+    """Connected components of the 'within threshold' relation (union-find)."""
+    parent: Dict[str, str] = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for path, dh in items:
+        for _d, other in tree.search(dh, threshold):
+            if other != path:
+                parent[find(other)] = find(path)
+    groups = defaultdict(list)
+    for x in list(parent):
+        groups[find(x)].append(x)
+    return [sorted(g) for g in groups.values() if len(g) > 1]
+
+def iter_images(root: Path, recursive: bool):
+    pattern = root.rglob("*") if recursive else root.iterdir()
+    return sorted(p for p in pattern if p.is_file() and p.suffix.lower() in IMAGE_EXTS)
+
+def main():
+    ap = argparse.ArgumentParser(description="Find exact and near-duplicate photos using a persistent hash index.")
+    ap.add_argument("folder", help="Library folder to index (e.g. ./foto)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Scan subfolders too")
+    ap.add_argument("--index", default=str(DEFAULT_INDEX), help="Index file (default: %(default)s)")
+    ap.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                    help="Max differing dHash bits for a near-duplicate (default: %(default)s)")
+    ap.add_argument("--check", nargs="+", metavar="FILE",
+                    help="Only check these incoming files against the index (they are not added)")
+    args = ap.parse_args()
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit("Path is not a folder.")
+    index = HashIndex(Path(args.index).expanduser())
+
+    if args.check:
+        tree, by_chash = build_tree(index, root)
+        hits = 0
+        for name in args.check:
+            p = Path(name).expanduser().resolve()
+            try:
+                chash, dh = index.hashes(p, store=False)
+            except Exception as e:
+                print(f"ERROR: {p}: {e}", file=sys.stderr)
+                continue
+            exact = [o for o in by_chash.get(chash, []) if o != str(p)]
+            near = sorted((d, o) for d, o in tree.search(dh, args.threshold) if o not in exact and o != str(p))
+            if exact or near:
+                hits += 1
+                print(p)
+                for o in exact:
+                    print(f"  = {o}")
+                for d, o in near:
+                    print(f"  ~{d:<2} {o}")
+        index.close()
+        print(f"\n{hits} of {len(args.check)} file(s) already in the library.")
+        sys.exit(1 if hits else 0)
+
+    files = iter_images(root, args.recursive)
+    seen, items, errors = set(), [], 0
+    for p in files:
+        try:
+            chash, dh = index.hashes(p)
+        except Exception as e:
+            errors += 1
+            print(f"ERROR: {p}: {e}", file=sys.stderr)
+            continue
+        seen.add(str(p))
+        items.append((str(p), dh))
+    pruned = index.prune(root, seen, args.recursive)
+    index.db.commit()
+
+    tree, by_chash = build_tree(index, root)
+    exact = [sorted(v) for v in by_chash.values() if len(v) > 1]
+    chash_of = {p: c for c, paths in by_chash.items() for p in paths}
+    # Groups made only of byte-identical copies are already listed as exact
+    near = [g for g in near_groups(tree, items, args.threshold) if len({chash_of[p] for p in g}) > 1]
+    index.close()
+
+    for g in exact:
+        print("EXACT  " + "  ==  ".join(g))
+    for g in near:
+        print("NEAR   " + "  ~~  ".join(g))
+    print(f"\nIndexed {len(items)} image(s) ({pruned} stale row(s) pruned, {errors} error(s)): "
+          f"{len(exact)} exact and {len(near)} near-duplicate group(s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Export the photos of a day, a month, a date range and/or some senders as one ZIP.
+- Photos are picked from the entry data the page uses: the manifest shards when
+  manifest/index.json exists (only the months in range are read), the #data
+  markup of index.html otherwise.
+- Streamed: entries are stored (JPEG/HEIC/PNG are already compressed, deflating
+  them again costs CPU for nothing), CRCs go in data descriptors, and files are
+  read in CHUNK-sized pieces, so memory stays flat and no temp file is written
+  however large the archive. ZIP64 kicks in past 4 GiB / 65535 files.
+- The archive size is known before the first byte (stored entries), so the
+  server sends a Content-Length and browsers show real progress.
+- server.py mounts GET /api/export?month=2024-04 (or day=, from=&to=, sender=...).
+
+Usage:
+  python3 export_zip.py --month 2024-04 -o aprile.zip
+  python3 export_zip.py --from 2024-04-01 --to 2024-06-30 --sender "Fra 🍐" -o - > fra.zip
+  python3 export_zip.py --day 2024-04-25 --list
+"""
+
+import argparse
+import asyncio
+import re
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+import perf
+from manifest import INDEX_NAME, load_json, parse_html_entries
+from gallery_http import GalleryServer, HttpError, Request, head_bytes
+
+CHUNK = 1 << 20
+DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+U32 = 0xFFFFFFFF
+FLAGS = 0x0808  # bit 3: CRC/sizes in a data descriptor; bit 11: UTF-8 names
+
+class Member(NamedTuple):
+    name: str    # path inside the archive
+    path: Path
+    size: int
+    mtime: float
+
+# ---------- selection ----------
+
+def valid(value: str, pattern: re.Pattern, fmt: str) -> bool:
+    # The regex pins the zero-padded layout strptime would let slide; strptime rejects 2020-13
+    if not pattern.match(value):
+        return False
+    try:
+        datetime.strptime(value, fmt)
+    except ValueError:
+        return False
+    return True
+
+def date_range(day: str = "", month: str = "", start: str = "", end: str = "") -> Tuple[str, str]:
+    """Inclusive (first, last) day as ISO strings; ISO dates compare correctly as text."""
+    if day:
+        if not valid(day, DAY_RE, "%Y-%m-%d"):
+            raise ValueError("day must be a date, YYYY-MM-DD")
+        return day, day
+    if month:
+        if not valid(month, MONTH_RE, "%Y-%m"):
+            raise ValueError("month must be a month, YYYY-MM")
+        return f"{month}-01", f"{month}-31"
+    for v in (start, end):
+        if v and not valid(v, DAY_RE, "%Y-%m-%d"):
+            raise ValueError("from/to must be dates, YYYY-MM-DD")
+    return start or "0000-00-00", end or "9999-99-99"
+
+def entry_days(root: Path, first: str, last: str, manifest_dir: str = "manifest",
+               html: str = "index.html") -> Iterator[Tuple[str, List[dict]]]:
+    """(day, entries) in day order within [first, last], from the manifest or the page."""
+    index = load_json(root / manifest_dir / INDEX_NAME, None)
+    if index is None:
+        days = parse_html_entries((root / html).read_text(encoding="utf-8"))
+        for day in sorted(d for d in days if first <= d <= last):
+            yield day, days[day]
+        return
+    for month in sorted(m for m in index.get("months", {}) if first[:7] <= m <= last[:7]):
+        shard = load_json(root / manifest_dir / f"{month}.json", {})
+        for day in sorted(d for d in shard if first <= d <= last):
+            yield day, shard[day]
+
+def src_path(root: Path, src: str) -> Optional[Path]:
+    """The file behind an entry's src, if it is inside root."""
+    rel = unquote(urlsplit(src).path).lstrip("/")
+    while rel.startswith("./"):
+        rel = rel[2:]
+    p = (root / rel).resolve()
+    if root not in p.parents or not p.is_file():
+        return None
+    return p
+
+def select(root: Path, days: Iterable[Tuple[str, List[dict]]], senders: Iterable[str] = ()) -> Tuple[List[Member], int]:
+    """Archive members as <day>/<file name>, each file once, plus how many entries had no file."""
+    senders = set(senders)
+    members: List[Member] = []
+    names = set()
+    paths = set()
+    missing = 0
+    for day, entries in days:
+        for e in entries:
+            if senders and e.get("sender") not in senders:
+                continue
+            p = src_path(root, e["src"])
+            if p is None:
+                missing += 1
+                continue
+            if p in paths:
+                continue  # several entries for one file (re-posted photo): archive it once
+            paths.add(p)
+            name = f"{day}/{p.name}"
+            n = 1
+            while name.lower() in names:
+                n += 1
+                name = f"{day}/{p.stem}-{n}{p.suffix}"
+            names.add(name.lower())
+            st = p.stat()
+            members.append(Member(name, p, st.st_size, st.st_mtime))
+    return members, missing
+
+# ---------- streaming ZIP ----------
+
+def dos_datetime(ts: float) -> Tuple[int, int]:
+    t = time.localtime(max(ts, 315532800))  # ZIP dates start in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+           ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+class ZipStream:
+    """
+    A stored-entries ZIP laid out in advance: .size is exact before streaming, and
+    chunks() reads each file once, in CHUNK pieces, computing CRCs on the way.
+    Only the central directory (~100 bytes per member) is kept in memory.
+    """
+
+    def __init__(self, members: List[Member]):
+        self.members = members
+        self.offsets = []
+        pos = 0
+        for m in members:
+            self.offsets.append(pos)
+            big = m.size >= U32
+            pos += 30 + len(m.name.encode("utf-8")) + (20 if big else 0)  # local header
+            pos += m.size + (24 if big else 16)                           # data + descriptor
+        self.cd_offset = pos
+        self.cd_size = sum(46 + len(m.name.encode("utf-8")) + len(self._zip64_extra(m, off))
+                           for m, off in zip(members, self.offsets))
+        end = self.cd_offset + self.cd_size
+        self.zip64_end = len(members) >= 0xFFFF or self.cd_offset >= U32 or self.cd_size >= U32
+        self.size = end + (56 + 20 if self.zip64_end else 0) + 22
+
+    @staticmethod
+    def _zip64_extra(m: Member, offset: int) -> bytes:
+        fields = []
+        if m.size >= U32:
+            fields += [m.size, m.size]  # uncompressed, compressed
+        if offset >= U32:
+            fields.append(offset)
+        if not fields:
+            return b""
+        return struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields)
+
+    def _local_header(self, m: Member) -> bytes:
+        name = m.name.encode("utf-8")
+        big = m.size >= U32
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if big else b""
+        t, d = dos_datetime(m.mtime)
+        return struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if big else 20, FLAGS, 0, t, d,
+                           0, U32 if big else 0, U32 if big else 0, len(name), len(extra)) + name + extra
+
+    def _central(self, m: Member, crc: int, offset: int) -> bytes:
+        name = m.name.encode("utf-8")
+        extra = self._zip64_extra(m, offset)
+        t, d = dos_datetime(m.mtime)
+        size32 = U32 if m.size >= U32 else m.size
+        return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | 45, 45 if extra else 20, FLAGS, 0, t, d,
+                           crc, size32, size32, len(name), len(extra), 0, 0, 0, 0o100644 << 16,
+                           min(offset, U32)) + name + extra
+
+    def chunks(self) -> Iterator[bytes]:
+        central = []
+        for m, offset in zip(self.members, self.offsets):
+            yield self._local_header(m)
+            crc, left = 0, m.size
+            with open(m.path, "rb") as f:
+                while left:
+                    block = f.read(min(CHUNK, left))
+                    if not block:
+                        raise IOError(f"{m.path} shrank while exporting")
+                    crc = zlib.crc32(block, crc)
+                    left -= len(block)
+                    yield block
+            if m.size >= U32:
+                yield struct.pack("<IIQQ", 0x08074B50, crc, m.size, m.size)
+            else:
+                yield struct.pack("<IIII", 0x08074B50, crc, m.size, m.size)
+            central.append(self._central(m, crc, offset))
+        yield b"".join(central)
+        n = len(self.members)
+        if self.zip64_end:
+            end64 = self.cd_offset + self.cd_size
+            yield struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, (3 << 8) | 45, 45, 0, 0, n, n,
+                              self.cd_size, self.cd_offset)
+            yield struct.pack("<IIQI", 0x07064B50, 0, end64, 1)
+        yield struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, min(n, 0xFFFF), min(n, 0xFFFF),
+                          min(self.cd_size, U32), min(self.cd_offset, U32), 0)
+
+# ---------- server endpoint ----------
+
+def archive_label(first: str, last: str, senders: List[str]) -> str:
+    label = first if first == last else (first[:7] if first.endswith("-01") and last == f"{first[:7]}-31"
+                                         else f"{first}_{last}".replace("0000-00-00", "inizio").replace("9999-99-99", "oggi"))
+    if senders:
+        label += "-" + "-".join(re.sub(r"[^\w]+", "", s) or "mittente" for s in senders)
+    return f"piccolamimi-{label}.zip"
+
+def mount(server: GalleryServer, prefix: str = "/api/export"):
+    async def handle(req: Request, writer: asyncio.StreamWriter):
+        if req.method not in ("GET", "HEAD"):
+            raise HttpError(405)
+        q = {k: v[0] for k, v in req.query.items()}
+        try:
+            first, last = date_range(q.get("day", ""), q.get("month", ""), q.get("from", ""), q.get("to", ""))
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        senders = req.query.get("sender", [])
+        if first == "0000-00-00" and last == "9999-99-99" and not senders:
+            raise HttpError(400, "day, month, from/to or sender required")
+        loop = asyncio.get_running_loop()
+        members, _missing = await loop.run_in_executor(
+            None, lambda: select(server.root, entry_days(server.root, first, last), senders))
+        if not members:
+            raise HttpError(404, "no photos in this selection")
+        z = ZipStream(members)
+        name = archive_label(first, last, senders)
+        writer.write(head_bytes(200, [
+            ("Content-Type", "application/zip"),
+            ("Content-Length", str(z.size)),
+            ("Content-Disposition", f"attachment; filename=\"{name.encode('ascii', 'ignore').decode()}\"; "
+                                    f"filename*=UTF-8''{quote(name)}"),
+            ("Cache-Control", "no-store"),
+            ("Connection", "keep-alive" if req.keep_alive else "close"),
+        ]))
+        await writer.drain()
+        if req.method == "GET":
+            it = z.chunks()
+            try:
+                while True:
+                    block = await loop.run_in_executor(None, next, it, None)  # disk reads off the loop
+                    if block is None:
+                        break
+                    writer.write(block)
+                    await writer.drain()  # waits for the client: one chunk in flight at most
+            except IOError:
+                return False  # body can't match Content-Length any more
+            finally:
+                it.close()
+        server.log(req, 200)
+
+    server.route(prefix, handle)
+
+def main():
+    ap = argparse.ArgumentParser(description="Stream a day/month/range/sender selection of photos into a ZIP.")
+    ap.add_argument("--day", default="", help="One day (YYYY-MM-DD)")
+    ap.add_argument("--month", default="", help="One month (YYYY-MM)")
+    ap.add_argument("--from", dest="start", default="", help="First day of a range (YYYY-MM-DD)")
+    ap.add_argument("--to", dest="end", default="", help="Last day of a range (YYYY-MM-DD)")
+    ap.add_argument("--sender", action="append", default=[], help="Only this data-sender (repeatable)")
+    ap.add_argument("--root", default=".", help="Gallery root with index.html/manifest (default: .)")
+    ap.add_argument("--manifest-dir", default="manifest", help="Manifest dir relative to --root (default: manifest)")
+    ap.add_argument("-o", "--out", default="", help="ZIP to write, '-' for stdout")
+    ap.add_argument("--list", action="store_true", help="List the selected photos instead of writing")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    try:
+        first, last = date_range(args.day, args.month, args.start, args.end)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    root = Path(args.root).expanduser().resolve()
+    members, missing = select(root, entry_days(root, first, last, args.manifest_dir), args.sender)
+    if missing:
+        print(f"{missing} entry(ies) without a file skipped.", file=sys.stderr)
+    if not members:
+        raise SystemExit("No photos in this selection.")
+    z = ZipStream(members)
+    if args.list or not args.out:
+        for m in members:
+            print(f"{m.size:>12,}  {m.name}")
+        print(f"\n{len(members)} photo(s), {z.size / (1 << 20):.1f} MiB ZIP"
+              + ("" if args.list else " (use -o FILE or -o - to write it)"))
+        return
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    try:
+        with perf.stage("zip", args.out) as span:
+            for block in z.chunks():
+                out.write(block)
+            span.read, span.written, span.items = sum(m.size for m in members), z.size, len(members)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    if args.out != "-":
+        print(f"Wrote {args.out}: {len(members)} photo(s), {z.size / (1 << 20):.1f} MiB")
+
+if __name__ == "__main__":
+    main()
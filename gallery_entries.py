@@ -0,0 +1,169 @@
+"""
+Entry rendering shared by the generators (create_entries.py, macos_create_entries.py,
+merge_entries.py, update_entries.py, import_photos.py, watch_photos.py):
+- collect_files()/group_by_day(): images under a folder, grouped by the YYYY-MM-DD
+  (or YYYY_MM_DD) at the start of the filename
+- build_figure()/build_entries(): the <section>/<figure> markup of index.html
+- build_manifest(): the same data as manifest.py shard entries
+- build_srcset(): the make_derivatives.py variants that exist, plus the original as
+  the largest candidate
+"""
+
+import html
+import re
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import perf
+from image_meta import ImageMeta, MetaCache, header_size, html_attrs
+from make_derivatives import DEFAULT_WIDTHS, existing_variants, variant_path
+
+DEFAULT_EXTS = {".jpg", ".jpeg"}  # extend via --ext (png/webp/etc.)
+
+# Start-of-stem match. Accepts "-" or "_" as separators: 2024-04-26, 2024_04_26.
+DATE_ONLY_RE = re.compile(r"^(?P<y>\d{4})[-_](?P<m>\d{2})[-_](?P<d>\d{2})")
+
+# Calendar cells are ~1/7 of a 1200px wrap; the hidden #data copy renders at 1px
+DEFAULT_SIZES = "(max-width: 700px) 14vw, 170px"
+
+CAPTION_PLACEHOLDER = "Placeholder — scrivi qui la descrizione."
+
+def natural_key(s: str):
+    # Human-ish sort: file2 < file10
+    return [int(t) if t.isdigit() else t.lower() for t in re.split(r"(\d+)", s)]
+
+@perf.timed("collect_files")
+def collect_files(root: Path, recursive: bool, exts: List[str]) -> List[Path]:
+    extset = {"." + e.lower().lstrip(".") for e in exts} if exts else set(DEFAULT_EXTS)
+    if recursive:
+        files = [p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in extset]
+    else:
+        files = [p for p in root.iterdir() if p.is_file() and p.suffix.lower() in extset]
+    # Sort by relative path string naturally for deterministic order across subfolders
+    files.sort(key=lambda p: natural_key(p.relative_to(root).as_posix()))
+    return files
+
+def parse_day_from_stem(stem: str) -> str:
+    m = DATE_ONLY_RE.match(stem)
+    if not m:
+        raise ValueError("filename does not start with YYYY-MM-DD or YYYY_MM_DD")
+    y, mo, d = int(m.group("y")), int(m.group("m")), int(m.group("d"))
+    datetime(y, mo, d)  # sanity
+    return f"{y:04d}-{mo:02d}-{d:02d}"
+
+def group_by_day(files: List[Path]) -> Tuple[Dict[str, List[Path]], List[Path]]:
+    """day -> files (in the given order) by filename date, plus the files without one."""
+    groups: Dict[str, List[Path]] = defaultdict(list)
+    skipped = []
+    for p in files:
+        try:
+            groups[parse_day_from_stem(p.stem)].append(p)
+        except ValueError:
+            skipped.append(p)
+    return groups, skipped
+
+def src_url(path: Path, root: Path, base_url: str) -> str:
+    rel = path.relative_to(root).as_posix()
+    return f"{base_url.rstrip('/')}/{rel}" if base_url else rel
+
+def display_width(path: Path, m: Optional[ImageMeta]) -> int:
+    """Width as shown (EXIF-rotated), from the meta cache or the file header; 0 if unknown."""
+    if m:
+        return m.width
+    try:
+        size = header_size(path)
+    except OSError:
+        return 0
+    return size[0] if size else 0
+
+def build_srcset(rel: Path, derivatives: Path, derivatives_url: str, ext: str,
+                 src: str = "", width: int = 0) -> str:
+    """
+    "url 160w, url 480w, ..., src <width>w" for the variants of <rel> that exist on disk.
+    The original closes the list so 2x/3x screens pick it over upscaling the largest
+    variant; browsers sniff the format, so it is valid in the WebP <source> too.
+    """
+    prefix = derivatives_url.rstrip("/")
+    parts = []
+    for w in existing_variants(derivatives, rel, ext, DEFAULT_WIDTHS):
+        vrel = variant_path(Path(), rel, w, ext).as_posix()
+        parts.append(f"{prefix}/{vrel} {w}w" if prefix else f"{vrel} {w}w")
+    if parts and src and width:
+        parts.append(f"{src} {width}w")
+    return ", ".join(parts)
+
+def build_figure(path: Path, day: str, base_url: str, root: Path, sender: str, symbol: str,
+                 derivatives: Optional[Path] = None, derivatives_url: str = "",
+                 sizes: str = DEFAULT_SIZES, meta: Optional[MetaCache] = None) -> List[str]:
+    """Lines of one <figure> block (unindented), shared by full and incremental output."""
+    esc_sender = html.escape(sender, quote=True)
+    esc_symbol = html.escape(symbol, quote=True)
+    src = src_url(path, root, base_url)
+    rel = path.relative_to(root)
+    # Alt text: simple and non-annoying. If you want the filename, swap to path.stem.
+    alt = day
+    lines = [f'<figure data-sender="{esc_sender}" data-symbol="{esc_symbol}">']
+    m = meta.get(path) if meta else None
+    webp = jpg = ""
+    if derivatives:
+        width = display_width(path, m)
+        webp = build_srcset(rel, derivatives, derivatives_url, ".webp", src, width)
+        jpg = build_srcset(rel, derivatives, derivatives_url, ".jpg", src, width)
+    # width/height + placeholder so the page can reserve space before the image arrives
+    dims = html_attrs(m)
+    if webp or jpg:
+        lines.append('  <picture>')
+        if webp:
+            lines.append(f'    <source type="image/webp" srcset="{html.escape(webp)}" sizes="{sizes}" />')
+        srcset = f' srcset="{html.escape(jpg)}" sizes="{sizes}"' if jpg else ""
+        lines.append(f'    <img src="{src}"{srcset} loading="lazy" alt="{alt}"{dims} />')
+        lines.append('  </picture>')
+    else:
+        lines.append(f'  <img src="{src}" alt="{alt}"{dims} />')
+    lines.append(f'  <figcaption>{CAPTION_PLACEHOLDER}</figcaption>')
+    lines.append('</figure>')
+    return lines
+
+@perf.timed("build_entries", written=lambda html: len(html.encode("utf-8")))
+def build_entries(groups: Dict[str, List[Path]], base_url: str, root: Path,
+                  sender: str, symbol: str, derivatives: Optional[Path] = None,
+                  derivatives_url: str = "", sizes: str = DEFAULT_SIZES,
+                  meta: Optional[MetaCache] = None) -> str:
+    lines: List[str] = []
+    for day in sorted(groups.keys()):
+        lines.append(f'<section data-date="{day}">')
+        for path in groups[day]:
+            fig = build_figure(path, day, base_url, root, sender, symbol, derivatives, derivatives_url, sizes, meta)
+            lines.extend("  " + line for line in fig)
+        lines.append('</section>')
+    return "\n".join(lines)
+
+def build_manifest(groups: Dict[str, List[Path]], base_url: str, root: Path,
+                   sender: str, symbol: str, derivatives: Optional[Path] = None,
+                   derivatives_url: str = "", meta: Optional[MetaCache] = None) -> Dict[str, List[dict]]:
+    """Same data as build_entries, as day -> [{src, sender, symbol, caption, srcset?, w?, h?, color?, lqip?}]."""
+    days: Dict[str, List[dict]] = {}
+    for day in sorted(groups.keys()):
+        entries = []
+        for path in groups[day]:
+            rel = path.relative_to(root)
+            src = src_url(path, root, base_url)
+            entry = {"src": src, "sender": sender, "symbol": symbol, "caption": CAPTION_PLACEHOLDER}
+            m = meta.get(path) if meta else None
+            if derivatives:
+                width = display_width(path, m)
+                srcset = (build_srcset(rel, derivatives, derivatives_url, ".webp", src, width)
+                          or build_srcset(rel, derivatives, derivatives_url, ".jpg", src, width))
+                if srcset:
+                    entry["srcset"] = srcset
+            if m:
+                entry.update(w=m.width, h=m.height)
+                if m.color:
+                    entry["color"] = m.color
+                if m.lqip:
+                    entry["lqip"] = m.lqip
+            entries.append(entry)
+        days[day] = entries
+    return days
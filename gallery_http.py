@@ -0,0 +1,236 @@
+"""
+HTTP plumbing of server.py, importable by the scripts that mount API endpoints on it
+(captions.py, export_zip.py):
+- Request/HttpError and the request reader/response writers for asyncio streams
+- GalleryServer: static files with loop.sendfile(), strong ETags/304, single-range
+  Range/If-Range, precompressed .gz siblings; only the top-level names in `expose`
+  (and never dot-files) are served; route(prefix, handler) mounts an API endpoint
+"""
+
+import asyncio
+import mimetypes
+import re
+import sys
+from contextlib import suppress
+from email.utils import formatdate
+from http import HTTPStatus
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_MAX_CONNECTIONS = 32
+# What the page loads: itself, the photos and what the generators write next to them
+DEFAULT_EXPOSE = ("index.html", "foto", "derivatives", "manifest", "atlas")
+IDLE_TIMEOUT = 15      # seconds a keep-alive connection may sit idle
+MAX_HEADERS = 100
+MAX_BODY = 1 << 20     # API request bodies; files are never uploaded
+HASHED_RE = re.compile(r"\.[0-9a-f]{10}\.[^./]+$")  # build_static.py names
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/heic", ".heic")
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, List[str]]
+    headers: Dict[str, str]  # lower-cased names
+    body: bytes
+    keep_alive: bool
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+Handler = Callable[[Request, asyncio.StreamWriter], Awaitable[Optional[bool]]]
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400)
+    headers: Dict[str, str] = {}
+    while True:
+        raw = await reader.readline()
+        if raw in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = raw.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > MAX_HEADERS:
+            raise HttpError(431)
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400)
+    if length > MAX_BODY:
+        raise HttpError(413)
+    body = await reader.readexactly(length) if length else b""
+    conn = headers.get("connection", "").lower()
+    keep_alive = conn != "close" if version == "HTTP/1.1" else conn == "keep-alive"
+    url = urlsplit(target)
+    return Request(method.upper(), unquote(url.path), parse_qs(url.query), headers, body, keep_alive)
+
+def head_bytes(status: int, headers: List[Tuple[str, str]]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    lines += [f"{k}: {v}" for k, v in headers]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def send_bytes(writer: asyncio.StreamWriter, status: int, body: bytes = b"",
+                     content_type: str = "text/plain; charset=utf-8",
+                     headers: List[Tuple[str, str]] = (), head_only: bool = False):
+    hdrs = [("Content-Type", content_type), ("Content-Length", str(len(body)))] + list(headers)
+    writer.write(head_bytes(status, hdrs))
+    if body and not head_only:
+        writer.write(body)
+    await writer.drain()
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (t.strip() for t in header.split(","))
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end inclusive) of a single byte range; None = ignore; raises 416."""
+    m = RANGE_RE.match(header.replace(" ", ""))
+    if not m or (not m.group(1) and not m.group(2)):
+        return None  # multi-range or malformed: send the whole file
+    if m.group(1):
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    else:
+        start, end = max(0, size - int(m.group(2))), size - 1
+    if start >= size or start > end:
+        raise HttpError(416)
+    return start, end
+
+class GalleryServer:
+    def __init__(self, root: Path, max_connections: int = DEFAULT_MAX_CONNECTIONS, quiet: bool = False,
+                 expose: Optional[Iterable[str]] = DEFAULT_EXPOSE):
+        self.root = root
+        self.expose = set(expose) if expose is not None else None  # None: everything under root
+        self.max_connections = max_connections
+        self.slots: Optional[asyncio.Semaphore] = None  # created on the serving loop
+        self.routes: Dict[str, Handler] = {}
+        self.quiet = quiet
+
+    def route(self, prefix: str, handler: Handler):
+        """Send requests for prefix (and below) to handler. A False return closes the connection."""
+        self.routes[prefix.rstrip("/")] = handler
+
+    def log(self, req: Request, status: int):
+        if not self.quiet:
+            print(f"{req.method} {req.path} {status}", flush=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async with self.slots:
+            try:
+                while True:
+                    try:
+                        req = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                    except HttpError as e:
+                        await send_bytes(writer, e.status, str(e).encode(), headers=[("Connection", "close")])
+                        break
+                    if req is None or not await self.dispatch(req, writer):
+                        break
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+                with suppress(Exception):
+                    await writer.wait_closed()
+
+    async def dispatch(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        """Serve one request; True if the connection can be reused."""
+        handler = next((h for p, h in self.routes.items() if req.path == p or req.path.startswith(p + "/")), None)
+        try:
+            if handler:
+                keep = await handler(req, writer)
+                return req.keep_alive and keep is not False
+            return await self.serve_file(req, writer)
+        except HttpError as e:
+            self.log(req, e.status)
+            headers = [("Connection", "keep-alive" if req.keep_alive else "close")]
+            if e.status == 405 and not handler:
+                headers.append(("Allow", "GET, HEAD"))
+            await send_bytes(writer, e.status, str(e).encode(), headers=headers, head_only=req.method == "HEAD")
+            return req.keep_alive
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return False
+        except Exception as e:
+            print(f"ERROR: {req.method} {req.path}: {e}", file=sys.stderr)
+            with suppress(Exception):
+                await send_bytes(writer, 500, b"Internal Server Error", headers=[("Connection", "close")])
+            return False
+
+    def resolve(self, url_path: str) -> Path:
+        rel = url_path.lstrip("/")
+        if any(part.startswith(".") for part in Path(rel).parts):
+            raise HttpError(404)  # state files, temp files, ..
+        p = (self.root / rel).resolve()
+        if p != self.root and self.root not in p.parents:
+            raise HttpError(404)
+        if p.is_dir():
+            p = p / "index.html"
+        if not p.is_file():
+            raise HttpError(404)
+        if self.expose is not None and p.relative_to(self.root).parts[0] not in self.expose:
+            raise HttpError(404)  # scripts, data/, entries, ... of a gallery served from its source tree
+        return p
+
+    async def serve_file(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        if req.method not in ("GET", "HEAD"):
+            raise HttpError(405)
+        path = self.resolve(req.path)
+        ctype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if ctype.startswith("text/") or ctype in ("application/json", "application/javascript"):
+            ctype += "; charset=utf-8"
+
+        body, encoding = path, None
+        gz = path.with_name(path.name + ".gz")
+        if "range" not in req.headers and "gzip" in req.headers.get("accept-encoding", "") and gz.is_file():
+            body, encoding = gz, "gzip"
+        st = body.stat()
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}{"-gz" if encoding else ""}"'
+        headers = [
+            ("Content-Type", ctype),
+            ("ETag", etag),
+            ("Last-Modified", formatdate(st.st_mtime, usegmt=True)),
+            ("Cache-Control", "public, max-age=31536000, immutable" if HASHED_RE.search(path.name) else "no-cache"),
+            ("Accept-Ranges", "bytes"),
+            ("Connection", "keep-alive" if req.keep_alive else "close"),
+        ]
+        if encoding:
+            headers += [("Content-Encoding", encoding), ("Vary", "Accept-Encoding")]
+
+        if etag_matches(req.headers.get("if-none-match"), etag):
+            writer.write(head_bytes(304, headers))
+            await writer.drain()
+            self.log(req, 304)
+            return req.keep_alive
+
+        status, offset, count = 200, 0, st.st_size
+        rng = req.headers.get("range")
+        if rng and req.headers.get("if-range", etag) == etag:
+            try:
+                span = parse_range(rng, st.st_size)
+            except HttpError:
+                headers.append(("Content-Range", f"bytes */{st.st_size}"))
+                await send_bytes(writer, 416, b"", headers=headers[1:])
+                self.log(req, 416)
+                return req.keep_alive
+            if span:
+                status, offset, count = 206, span[0], span[1] - span[0] + 1
+                headers.append(("Content-Range", f"bytes {span[0]}-{span[1]}/{st.st_size}"))
+        headers.append(("Content-Length", str(count)))
+
+        writer.write(head_bytes(status, headers))
+        await writer.drain()
+        if req.method == "GET" and count:
+            with open(body, "rb") as f:
+                await asyncio.get_running_loop().sendfile(writer.transport, f, offset, count)
+        self.log(req, status)
+        return req.keep_alive
@@ -0,0 +1,116 @@
+"""
+Small helpers shared by the entry/manifest scripts:
+- regexes for the <section data-date>/<figure> markup used in index.html and ./entries
+- atomic_write_text()/atomic_write_bytes(): temp file in the same dir + fsync + rename,
+  keeping the target's mode (new files get 0o666 minus the umask, like open() would)
+- atomic_open(): the same for output streamed piece by piece
+- save_durable()/output_complete(): the image-encoding variant (hidden .part file)
+  used by heic_convert.py and make_derivatives.py, and a trailer check for outputs
+  left truncated by older, non-atomic runs
+"""
+
+import os
+import re
+import tempfile
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from typing import IO, Iterator
+
+import perf
+
+SECTION_RE = re.compile(r'<section\b[^>]*\bdata-date="(\d{4}-\d{2}-\d{2})"[^>]*>(.*?)</section>', re.S)
+SECTION_OPEN_RE = re.compile(r'<section\b[^>]*\bdata-date="(\d{4}-\d{2}-\d{2})"[^>]*>')
+FIGURE_RE = re.compile(r"<figure\b.*?</figure>", re.S)
+IMG_SRC_RE = re.compile(r'<img\b[^>]*?\bsrc="([^"]+)"')
+DATA_OPEN_RE = re.compile(r'<div\b[^>]*\bid="data"[^>]*>')
+
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+# Read once at import: os.umask() can only be read by setting it
+NEW_FILE_MODE = 0o666 & ~_read_umask()
+
+def atomic_write_text(path: Path, text: str):
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Write next to the target, fsync, then rename over it."""
+    with atomic_open(path, "wb") as fh:
+        fh.write(data)
+
+@contextmanager
+def atomic_open(path: Path, mode: str = "w") -> Iterator[IO]:
+    """
+    A temp file next to the target to write into; it is fsynced and renamed over the
+    target when the block ends, and removed if the block raises, so the target is
+    either untouched or complete.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as fh:
+            # mkstemp creates 0600: a web server running as another user couldn't read it
+            try:
+                st_mode = path.stat().st_mode & 0o777
+            except FileNotFoundError:
+                st_mode = NEW_FILE_MODE
+            os.fchmod(fh.fileno(), st_mode)
+            yield fh
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def fsync_dir(d: Path):
+    # Makes a rename durable; not possible (nor needed) on every platform
+    with suppress(OSError):
+        fd = os.open(d, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def part_path(dst: Path) -> Path:
+    return dst.with_name(f".{dst.name}.part")
+
+def save_durable(im, dst: Path, save_kwargs: dict):
+    """
+    Encode a PIL image to a hidden .part file, fsync, rename over dst. dst is therefore
+    either missing or complete, and durable once this returns: callers may delete the source.
+    """
+    tmp = part_path(dst)
+    with perf.stage("save", str(dst)) as span:
+        try:
+            with open(tmp, "wb") as fh:
+                im.save(fh, **save_kwargs)
+                fh.flush()
+                os.fsync(fh.fileno())
+                span.written = fh.tell()
+            os.replace(tmp, dst)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+        fsync_dir(dst.parent)
+
+def output_complete(dst: Path) -> bool:
+    """Cheap trailer check, so a truncated file left by an older, non-atomic run is redone."""
+    try:
+        size = dst.stat().st_size
+        with open(dst, "rb") as f:
+            head = f.read(12)
+            f.seek(max(0, size - 16))
+            tail = f.read()
+    except OSError:
+        return False
+    if head[:2] == b"\xff\xd8":
+        return tail.rstrip(b"\0")[-2:] == b"\xff\xd9"  # JPEG EOI
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return tail[-8:-4] == b"IEND"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return int.from_bytes(head[4:8], "little") + 8 <= size
+    return size > 0
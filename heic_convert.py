@@ -1,77 +1,272 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import json
 import os
+import sys
+from collections import deque
+from contextlib import suppress
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from PIL import Image, ImageCms
 import pillow_heif
 from io import BytesIO
 
+import perf
+from gallery_io import atomic_write_text, output_complete, part_path, save_durable
+
 pillow_heif.register_heif_opener()
 
+# One sRGB transform per distinct source profile (per worker process). Nearly all
+# iPhone shots carry the same Display P3 profile, so this is built once, not per image.
+_TRANSFORMS = {}
+_SRGB = None
+
+LABELS = {"jpg": "JPG", "png": "PNG", "webp": "WEBP"}
+JOURNAL_NAME = ".heic_convert_journal.jsonl"
+
+class OutputSpec(NamedTuple):
+    fmt: str                 # jpg | png | webp
+    quality: int
+    max_dim: Optional[int]   # longest side in px, None = full size
+
+def parse_output_spec(spec: str, default_quality: int) -> OutputSpec:
+    """'jpg', 'jpg:90', 'webp:80:2048' -> OutputSpec."""
+    parts = spec.lower().split(":")
+    fmt = parts[0]
+    if fmt not in LABELS:
+        raise argparse.ArgumentTypeError(f"unsupported format {fmt!r} (use jpg, png or webp)")
+    quality = int(parts[1]) if len(parts) > 1 and parts[1] else default_quality
+    max_dim = int(parts[2]) if len(parts) > 2 and parts[2] else None
+    return OutputSpec(fmt, quality, max_dim)
+
+def output_name(stem: str, spec: OutputSpec) -> str:
+    return f"{stem}-{spec.max_dim}.{spec.fmt}" if spec.max_dim else f"{stem}.{spec.fmt}"
+
+def srgb_transform(icc_bytes: bytes) -> Tuple[str, object]:
+    """(input mode, transform to sRGB RGB); the input mode follows the profile's colour space."""
+    global _SRGB
+    key = hashlib.sha1(icc_bytes).hexdigest()
+    cached = _TRANSFORMS.get(key)
+    if cached is None:
+        if _SRGB is None:
+            _SRGB = ImageCms.createProfile("sRGB")
+        src = ImageCms.ImageCmsProfile(BytesIO(icc_bytes))
+        mode = "L" if src.profile.xcolor_space.strip() == "GRAY" else "RGB"
+        cached = (mode, ImageCms.buildTransform(src, _SRGB, mode, "RGB"))
+        _TRANSFORMS[key] = cached
+    return cached
+
+@perf.timed("srgb")
 def to_srgb(img: Image.Image, icc_bytes: Optional[bytes]) -> Image.Image:
-    """Convert image to sRGB if an ICC profile is present; otherwise ensure 8-bit RGB."""
+    """Convert image to sRGB if an ICC profile is present; either way return 8-bit RGB."""
     if icc_bytes:
         try:
-            src = ImageCms.ImageCmsProfile(BytesIO(icc_bytes))
-            dst = ImageCms.createProfile("sRGB")
-            # Some HEICs are not in RGB mode; ImageCms will handle conversion
-            img = ImageCms.profileToProfile(img, src, dst, outputMode="RGB")
-            return img
-        except Exception:
-            pass  # if conversion fails, fall through to simple convert
+            mode, tr = srgb_transform(icc_bytes)
+            # Grey profiles take L, RGB ones RGB (alpha is dropped, as the fallback below does)
+            if img.mode != mode:
+                img = img.convert(mode)
+            return ImageCms.applyTransform(img, tr)
+        except Exception as e:
+            print(f"WARNING: sRGB conversion failed ({e}); colours left unconverted", file=sys.stderr)
     return img.convert("RGB")
 
-def convert_one(src: Path, dst: Path, to_fmt: str, quality: int, srgb: bool, overwrite: bool, dry: bool) -> str:
-    if not overwrite and dst.exists():
-        return f"SKIP (exists): {src.name} -> {dst.name}"
+def shrink(img: Image.Image, max_dim: Optional[int]) -> Image.Image:
+    """Fit within max_dim; reducing_gap lets Pillow reduce() by an integer factor first."""
+    if not max_dim or max(img.size) <= max_dim:
+        return img
+    scale = max_dim / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+def save_kwargs_for(spec: OutputSpec, exif_bytes: Optional[bytes], icc: Optional[bytes]) -> dict:
+    if spec.fmt == "jpg":
+        kw = dict(format="JPEG", quality=spec.quality, optimize=True, progressive=True)
+    elif spec.fmt == "webp":
+        kw = dict(format="WEBP", quality=spec.quality, method=4)
+    else:
+        # PNG has no widely supported EXIF; we keep ICC profile if present
+        return dict(format="PNG", optimize=True, **({"icc_profile": icc} if icc else {}))
+    if exif_bytes:
+        kw["exif"] = exif_bytes
+    if icc:
+        kw["icc_profile"] = icc
+    return kw
+
+@perf.timed("convert", read=perf.file_size, profile=True)
+def convert_one(src: Path, outputs: List[Tuple[Path, OutputSpec]], srgb: bool, overwrite: bool, dry: bool) -> str:
+    """
+    Decode src once and encode every (dst, spec) from it. Outputs are produced
+    largest -> smallest, each resized from the previous one; when no full-size
+    output is wanted the image is shrunk before colour conversion.
+    """
+    if not dry:
+        # Left behind by a run killed mid-save; outputs already complete would otherwise keep them
+        for dst, _ in outputs:
+            with suppress(FileNotFoundError):
+                os.remove(part_path(dst))
+    todo = [(dst, spec) for dst, spec in outputs if overwrite or not output_complete(dst)]
+    if not todo:
+        return f"SKIP (exists): {src.name} -> {', '.join(d.name for d, _ in outputs)}"
+    if dry:
+        return "; ".join(f"{LABELS[spec.fmt]}: {src.name} -> {dst.name}" for dst, spec in todo)
+
+    todo.sort(key=lambda o: -(o[1].max_dim or float("inf")))
+    msgs = []
     with Image.open(src) as im:
         exif_bytes = im.info.get("exif")  # pillow-heif exposes HEIC EXIF here when present
         icc = im.info.get("icc_profile")
+        with perf.stage("decode", str(src)):
+            im.load()
 
+        cur = shrink(im, todo[0][1].max_dim)
         if srgb:
-            im = to_srgb(im, icc)
+            cur = to_srgb(cur, icc)
             icc_to_save = None  # already converted, no need to embed original ICC
         else:
             # Ensure we don't accidentally save in modes some encoders hate
-            if im.mode not in ("RGB", "L", "LA", "RGBA"):
-                im = im.convert("RGB")
+            if cur.mode not in ("RGB", "L", "LA", "RGBA"):
+                cur = cur.convert("RGB")
             icc_to_save = icc
 
-        if to_fmt == "jpg":
-            save_kwargs = dict(format="JPEG", quality=quality, optimize=True, progressive=True)
-            if exif_bytes:
-                save_kwargs["exif"] = exif_bytes
-            if icc_to_save:
-                save_kwargs["icc_profile"] = icc_to_save
-            if not dry:
-                im.save(dst, **save_kwargs)
-            return f"JPG: {src.name} -> {dst.name}"
-
-        elif to_fmt == "png":
-            # PNG has no widely supported EXIF; we keep ICC profile if present
-            save_kwargs = dict(format="PNG", optimize=True)
-            if icc_to_save:
-                save_kwargs["icc_profile"] = icc_to_save
-            if not dry:
-                im.save(dst, **save_kwargs)
-            return f"PNG: {src.name} -> {dst.name}"
+        for dst, spec in todo:
+            cur = shrink(cur, spec.max_dim)
+            out = cur
+            if spec.fmt == "jpg" and out.mode not in ("RGB", "L"):
+                out = out.convert("RGB")
+            save_durable(out, dst, save_kwargs_for(spec, exif_bytes, icc_to_save))
+            msgs.append(f"{LABELS[spec.fmt]}: {src.name} -> {dst.name}")
+    return "; ".join(msgs)
 
-        else:
-            return f"ERROR: unsupported format {to_fmt}"
+def _convert_safe(src: Path, *args) -> str:
+    # Workers report failures as a message instead of tearing down the pool
+    try:
+        return convert_one(src, *args)
+    except Exception as e:
+        return f"ERROR: {src.name}: {e}"
+
+def run_jobs(jobs: Iterable[Tuple[Path, tuple]], workers: int, max_inflight: int,
+             fn: Callable = _convert_safe) -> Iterator[Tuple[Path, object]]:
+    """
+    Yield (src, fn(src, *args)) in submission order. At most max_inflight jobs are
+    queued or running at once, which bounds how many decoded images exist in memory.
+    """
+    if workers <= 1:
+        for src, args in jobs:
+            yield src, fn(src, *args)
+        return
+    def result(fut):
+        if not perf.enabled:
+            return fut.result()
+        res, stats = fut.result()
+        perf.merge(stats)
+        return res
+
+    window = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for src, args in jobs:
+            if len(window) >= max_inflight:
+                done_src, fut = window.popleft()
+                yield done_src, result(fut)
+            if perf.enabled:  # ship the worker's timings back with each result
+                window.append((src, pool.submit(perf.call_and_drain, fn, src, *args)))
+            else:
+                window.append((src, pool.submit(fn, src, *args)))
+        while window:
+            done_src, fut = window.popleft()
+            yield done_src, result(fut)
+
+class RunJournal:
+    """
+    Append-only checkpoint of finished sources (one JSON line each, fsynced), so a
+    re-run or a run resumed after a crash skips them without opening any output.
+    A source is finished for as long as its size/mtime and the requested outputs
+    (key) are unchanged.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done = {}
+        self.lines = 0
+        self.fh = None
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    self.done[rec["src"]] = rec
+                    self.lines += 1
+        except FileNotFoundError:
+            pass
+
+    def finished(self, rel: str, st: os.stat_result, key: str) -> Optional[dict]:
+        rec = self.done.get(rel)
+        if rec and rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns and rec["key"] == key:
+            return rec
+        return None
+
+    def record(self, rel: str, st: os.stat_result, key: str, outputs: List[str], converted: bool):
+        rec = {"src": rel, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "key": key,
+               "outputs": outputs, "converted": converted}
+        self.done[rel] = rec
+        if self.fh is None:
+            self.fh = open(self.path, "a", encoding="utf-8")
+        self.fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.lines += 1
+
+    def close(self, sources: set):
+        """Forget sources that are gone (deleted originals) and fold repeated lines."""
+        if self.fh:
+            self.fh.close()
+        for rel in set(self.done) - sources:
+            del self.done[rel]
+        if self.lines > len(self.done):
+            atomic_write_text(self.path, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.done.values()))
+
+def outputs_key(outputs: List[Tuple[Path, OutputSpec]], srgb: bool) -> str:
+    return ("srgb|" if srgb else "icc|") + ",".join(f"{dst.name}:{spec.quality}" for dst, spec in outputs)
 
 def main():
-    ap = argparse.ArgumentParser(description="Convert HEIC to JPG or PNG, preserving color profile and (for JPG) EXIF.")
+    ap = argparse.ArgumentParser(description="Convert HEIC to JPG/PNG/WebP, preserving color profile and (for JPG/WebP) EXIF.")
     ap.add_argument("folder", help="Folder to scan")
     ap.add_argument("-r", "--recursive", action="store_true", help="Recurse into subfolders")
-    ap.add_argument("--to", choices=["jpg", "png"], default="jpg", help="Output format (default: jpg)")
-    ap.add_argument("--quality", type=int, default=92, help="JPEG quality 1-100 (default: 92)")
+    ap.add_argument("--to", choices=sorted(LABELS), default="jpg", help="Output format (default: jpg)")
+    ap.add_argument("--quality", type=int, default=92, help="JPEG/WebP quality 1-100 (default: 92)")
+    ap.add_argument("--output", action="append", metavar="FMT[:QUALITY[:MAXDIM]]",
+                    help="Output target, repeatable; all are encoded from one decode "
+                         "(e.g. --output jpg:92 --output webp:80:2048). Overrides --to/--quality")
     ap.add_argument("--outdir", type=str, default="", help="Output root directory (mirror tree). Default: alongside source")
     ap.add_argument("--overwrite", action="store_true", help="Overwrite existing outputs")
     ap.add_argument("--srgb", action="store_true", help="Convert colors to sRGB for maximum compatibility")
     ap.add_argument("--dry-run", action="store_true", help="Show what would happen, do not write files")
     ap.add_argument("--delete-original", action="store_true", help="Delete .HEIC after successful conversion (not used with --dry-run)")
+    ap.add_argument("--no-journal", action="store_true",
+                    help=f"Don't read or write the {JOURNAL_NAME} checkpoint (in --outdir, else the folder)")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="Parallel worker processes (default: 1; 0 = all cores)")
+    ap.add_argument("--max-inflight", type=int, default=0,
+                    help="Max conversions queued at once, bounds memory (default: 2 x jobs)")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
     args = ap.parse_args()
+    perf.setup(args.perf)
+
+    specs = [parse_output_spec(o, args.quality) for o in args.output] if args.output \
+        else [OutputSpec(args.to, args.quality, None)]
+    seen = set()
+    for spec in specs:
+        # Same format and size means the same output file: the second would overwrite the first
+        if (spec.fmt, spec.max_dim) in seen:
+            ap.error(f"--output {spec.fmt}{f'::{spec.max_dim}' if spec.max_dim else ''} given twice "
+                     "(one output per format and size)")
+        seen.add((spec.fmt, spec.max_dim))
+
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    max_inflight = args.max_inflight if args.max_inflight > 0 else 2 * workers
 
     root = Path(args.folder).expanduser().resolve()
     if not root.is_dir():
@@ -82,29 +277,61 @@ def main():
     heics.sort()
 
     out_root = Path(args.outdir).expanduser().resolve() if args.outdir else None
+    use_journal = not (args.no_journal or args.dry_run or args.overwrite)
+    journal = RunJournal((out_root or root) / JOURNAL_NAME) if use_journal else None
+    delete = args.delete_original and not args.dry_run
+    pending = {}  # src -> (rel, stat, key, outputs) until its result is in
+    resumed = 0
+
+    def delete_original(src: Path):
+        try:
+            os.remove(src)
+            print(f"Deleted original: {src}")
+        except Exception as e:
+            print(f"Failed to delete {src}: {e}")
+
+    def jobs():
+        nonlocal resumed
+        for src in heics:
+            rel = src.relative_to(root)
+            if out_root:
+                dst_dir = out_root / rel.parent
+            else:
+                dst_dir = src.parent
+            outputs = [(dst_dir / output_name(src.stem, spec), spec) for spec in specs]
+            key = outputs_key(outputs, args.srgb)
+            st = src.stat()
+            rec = journal.finished(rel.as_posix(), st, key) if journal else None
+            # An output deleted since: convert_one redoes only what's missing or truncated
+            if rec and all(d.exists() for d, _ in outputs):
+                resumed += 1
+                # Converted here earlier but interrupted before the delete: finish it now
+                if delete and rec["converted"] and all(output_complete(d) for d, _ in outputs):
+                    delete_original(src)
+                continue
+            dst_dir.mkdir(parents=True, exist_ok=True)
+            pending[src] = (rel.as_posix(), st, key, outputs)
+            yield src, (outputs, args.srgb, args.overwrite, args.dry_run)
+
     made = 0
-    for src in heics:
-        rel = src.relative_to(root)
-        stem = src.stem
-        ext = f".{args.to}"
-        if out_root:
-            dst_dir = out_root / rel.parent
-        else:
-            dst_dir = src.parent
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        dst = dst_dir / f"{stem}{ext}"
-
-        msg = convert_one(src, dst, args.to, args.quality, args.srgb, args.overwrite, args.dry_run)
-        print(msg)
-        if msg.startswith(("JPG:", "PNG:")):
-            made += 1
-            if args.delete_original and not args.dry_run:
-                try:
-                    os.remove(src)
-                    print(f"Deleted original: {src}")
-                except Exception as e:
-                    print(f"Failed to delete {src}: {e}")
+    # Results arrive in order, and only after the output was renamed into place and fsynced
+    try:
+        for src, msg in run_jobs(jobs(), workers, max_inflight):
+            print(msg)
+            rel, st, key, outputs = pending.pop(src)
+            converted = msg.startswith(tuple(f"{label}:" for label in LABELS.values()))
+            if journal and (converted or msg.startswith("SKIP")):
+                journal.record(rel, st, key, [d.name for d, _ in outputs], converted)
+            if converted:
+                made += 1
+                if delete:
+                    delete_original(src)
+    finally:
+        if journal:
+            journal.close({p.relative_to(root).as_posix() for p in heics if p.exists()})
 
+    if resumed:
+        print(f"\n{resumed} file(s) already done per {JOURNAL_NAME}.")
     print(f"\nDone. {'Would convert' if args.dry_run else 'Converted'} {made} file(s).")
 
 if __name__ == "__main__":
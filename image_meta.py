@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Pixel size and a tiny placeholder for every photo, for the entry generators.
+- Size and EXIF orientation come from the header alone (JPEG SOF/APP1, PNG IHDR/eXIf,
+  WebP VP8/VP8L/VP8X): nothing is decoded. Sizes are as displayed, i.e. swapped for
+  orientations 5-8, so width/height attributes match what the browser shows.
+- The placeholder is the average colour plus a ~16px blurred WebP data: URI, made
+  from a JPEG draft decode (1/8 scale). It needs Pillow; without it only the size
+  is emitted.
+- Results are cached in SQLite keyed by path/size/mtime, so regenerating entries for
+  thousands of photos only reads the new or changed ones.
+
+Usage (warm the cache ahead of a big regeneration):
+  python3 image_meta.py ./foto -r
+"""
+
+import argparse
+import base64
+import io
+import sqlite3
+import struct
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+DEFAULT_CACHE = Path.home() / ".cache" / "piccolamimi" / "image_meta.sqlite"
+LQIP_SIZE = 16
+TAG_ORIENTATION = 0x0112
+# SOF0..SOF15 minus DHT (C4), JPG (C8) and DAC (CC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+class ImageMeta(NamedTuple):
+    width: int
+    height: int
+    color: str = ""  # "#rrggbb"
+    lqip: str = ""   # data:image/webp;base64,...
+
+# ---------- header readers ----------
+
+def _tiff_orientation(tiff: bytes) -> int:
+    """Orientation tag of IFD0 in a TIFF-structured EXIF blob (1 when absent)."""
+    if tiff[:2] == b"II":
+        e = "<"
+    elif tiff[:2] == b"MM":
+        e = ">"
+    else:
+        return 1
+    try:
+        (ifd0,) = struct.unpack_from(e + "I", tiff, 4)
+        (n,) = struct.unpack_from(e + "H", tiff, ifd0)
+        for i in range(n):
+            tag, typ, _count, value = struct.unpack_from(e + "HHIH", tiff, ifd0 + 2 + 12 * i)
+            if tag == TAG_ORIENTATION and typ == 3:  # SHORT, stored inline
+                return value
+    except struct.error:
+        pass
+    return 1
+
+def _jpeg_header(f) -> Optional[Tuple[int, int, int]]:
+    """(width, height, orientation) from the markers before the first SOF."""
+    orientation = 1
+    f.seek(2)
+    while True:
+        b = f.read(1)
+        if b != b"\xff":
+            return None
+        while b == b"\xff":  # fill bytes
+            b = f.read(1)
+        if not b:
+            return None
+        marker = b[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # TEM/RSTn/SOI: no length
+            continue
+        if marker in (0xD9, 0xDA):
+            return None
+        raw = f.read(2)
+        if len(raw) < 2:
+            return None
+        (size,) = struct.unpack(">H", raw)
+        if marker in SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack(">HH", data[1:])
+            return w, h, orientation
+        if marker == 0xE1:
+            data = f.read(size - 2)
+            if data.startswith(b"Exif\0\0"):
+                orientation = _tiff_orientation(data[6:])
+        else:
+            f.seek(size - 2, 1)
+
+def _png_header(f) -> Optional[Tuple[int, int, int]]:
+    f.seek(8)
+    hdr = f.read(16)
+    if len(hdr) < 16 or hdr[4:8] != b"IHDR":
+        return None
+    w, h = struct.unpack(">II", hdr[8:16])
+    f.seek(8 + 8 + 13 + 4)
+    while True:  # eXIf must come before IDAT
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return w, h, 1
+        size, ctype = struct.unpack(">I4s", hdr)
+        if ctype == b"eXIf":
+            return w, h, _tiff_orientation(f.read(size))
+        if ctype in (b"IDAT", b"IEND"):
+            return w, h, 1
+        f.seek(size + 4, 1)
+
+def _webp_header(f) -> Optional[Tuple[int, int, int]]:
+    f.seek(12)
+    size = None
+    orientation = 1
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            break
+        ctype, clen = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+        data = f.read(min(clen, 30)) if ctype != b"EXIF" else f.read(clen)
+        if ctype == b"VP8X" and len(data) >= 10:
+            size = (1 + int.from_bytes(data[4:7], "little"), 1 + int.from_bytes(data[7:10], "little"))
+        elif ctype == b"VP8 " and size is None and len(data) >= 10:
+            w, h = struct.unpack("<HH", data[6:10])
+            size = (w & 0x3FFF, h & 0x3FFF)
+            break
+        elif ctype == b"VP8L" and size is None and len(data) >= 5:
+            (bits,) = struct.unpack("<I", data[1:5])
+            size = (1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF))
+            break
+        elif ctype == b"EXIF":
+            orientation = _tiff_orientation(data[6:] if data.startswith(b"Exif\0\0") else data)
+        f.seek(clen + (clen & 1) - len(data), 1)
+    return (*size, orientation) if size else None
+
+def header_size(path: Path) -> Optional[Tuple[int, int]]:
+    """Displayed (width, height) without decoding, or None for unknown formats."""
+    with open(path, "rb") as f:
+        head = f.read(12)
+        if head[:3] == b"\xff\xd8\xff":
+            found = _jpeg_header(f)
+        elif head[:8] == b"\x89PNG\r\n\x1a\n":
+            found = _png_header(f)
+        elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            found = _webp_header(f)
+        else:
+            return None
+    if not found:
+        return None
+    w, h, orientation = found
+    return (h, w) if orientation in (5, 6, 7, 8) else (w, h)
+
+# ---------- placeholder ----------
+
+def placeholder(path: Path) -> Tuple[str, str]:
+    """(average colour, blurred ~16px WebP data URI). Decodes at 1/8 scale at most."""
+    from PIL import Image, ImageFilter, ImageOps
+
+    with Image.open(path) as im:
+        im.draft("RGB", (LQIP_SIZE * 8, LQIP_SIZE * 8))
+        small = ImageOps.exif_transpose(im).convert("RGB")
+        small.thumbnail((LQIP_SIZE, LQIP_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    r, g, b = small.resize((1, 1), Image.BOX).getpixel((0, 0))
+    buf = io.BytesIO()
+    small.filter(ImageFilter.GaussianBlur(1)).save(buf, format="WEBP", quality=40, method=6)
+    return f"#{r:02x}{g:02x}{b:02x}", "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+def html_attrs(meta: Optional[ImageMeta]) -> str:
+    """' width=".." height=".." data-color=".." data-lqip=".."' for an <img>, or ''."""
+    if not meta:
+        return ""
+    out = f' width="{meta.width}" height="{meta.height}"'
+    if meta.color:
+        out += f' data-color="{meta.color}"'
+    if meta.lqip:
+        out += f' data-lqip="{meta.lqip}"'
+    return out
+
+# ---------- cache ----------
+
+class MetaCache:
+    """SQLite table of (path, size, mtime) -> (width, height, colour, LQIP)."""
+
+    def __init__(self, db_path: Path, placeholders: bool = True):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " width INTEGER NOT NULL, height INTEGER NOT NULL, color TEXT, lqip TEXT)"
+        )
+        self.placeholders = placeholders
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path) -> Optional[ImageMeta]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None  # e.g. a planned rename/conversion target in a dry run
+        row = self.db.execute(
+            "SELECT width, height, color, lqip FROM meta WHERE path=? AND size=? AND mtime_ns=?",
+            (str(path), st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if row:
+            self.hits += 1
+            return ImageMeta(row[0], row[1], row[2] or "", row[3] or "")
+        self.misses += 1
+        try:
+            size = header_size(path)
+        except OSError:
+            size = None
+        if size is None:
+            return None
+        if not self.placeholders:
+            return ImageMeta(*size)
+        try:
+            color, lqip = placeholder(path)
+        except ImportError:
+            # No Pillow: serve the size but don't cache, so a later run can add the placeholder
+            return ImageMeta(*size)
+        except Exception:
+            color, lqip = "", ""
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (str(path), st.st_size, st.st_mtime_ns, size[0], size[1], color, lqip),
+        )
+        return ImageMeta(size[0], size[1], color, lqip)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def main():
+    ap = argparse.ArgumentParser(description="Read sizes and build placeholders for photos into the cache.")
+    ap.add_argument("folder", help="Folder with images (e.g. ./foto)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Scan subfolders too")
+    ap.add_argument("--cache", default=str(DEFAULT_CACHE), help="Cache file (default: %(default)s)")
+    args = ap.parse_args()
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit("Path is not a folder.")
+    cache = MetaCache(Path(args.cache).expanduser())
+    files = root.rglob("*") if args.recursive else root.iterdir()
+    unknown = 0
+    for p in files:
+        if p.is_file() and p.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"}:
+            if cache.get(p) is None:
+                unknown += 1
+                print(f"Unreadable header: {p}")
+    cache.close()
+    print(f"{cache.hits + cache.misses} image(s): {cache.misses} read, {cache.hits} cached, {unknown} unreadable.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+One-pass import: capture date -> rename -> HEIC convert -> derivatives -> entries.
+Does what running rename_script.py, heic_convert.py, make_derivatives.py and
+(macos_)create_entries.py one after another does, but:
+- walks the folder once; every file is streamed through the stages,
+- the capture datetime read for naming is carried along and also decides the
+  entry's day and its order within the day (no filename re-parsing, no re-reads),
+- stages overlap: dates are read by a thread pool (I/O + exiftool), renames happen
+  in the main thread, decode/encode work runs in a process pool.
+
+Files without a usable date (or within --recent-days) keep their name, exactly as
+rename_script.py would skip them, but are still converted and emitted if their
+filename carries a date.
+
+Progress and log lines go to stderr; without --out/--update/--manifest, stdout
+carries only the generated HTML (so `> entries.html` works).
+
+Usage:
+  python3 import_photos.py ./foto --sender "Gegè 👨🏻" --symbol "👨🏻" --srgb --dry-run
+  python3 import_photos.py ./foto --sender "Fra 🍐" --symbol "🍐" --srgb -j 8 --update index.html
+  python3 import_photos.py ./foto --sender "Fra 🍐" --symbol "🍐" --derivatives ./derivatives --manifest ./manifest
+"""
+
+import argparse
+import os
+import sys
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import heic_convert
+import gallery_entries as entries
+import make_derivatives
+import perf
+import rename_script
+from image_meta import DEFAULT_CACHE as META_CACHE, MetaCache
+from manifest import write_manifest
+from update_entries import default_known, update_target
+
+HEIC_EXTS = {".heic"}
+
+class Item(NamedTuple):
+    path: Path
+    dt: Optional[datetime]
+    tag: Optional[str]
+
+def dated_items(files: List[Path], pool: ThreadPoolExecutor, window: int, cache, use_exiftool: bool) -> Iterator[Item]:
+    """
+    Capture dates in scan order. Cache hits are answered inline; misses are read by
+    the thread pool, up to `window` files ahead of the consumer.
+    """
+    pending = deque()
+
+    def pop():
+        f, st, qhash, fut, result = pending.popleft()
+        if fut is not None:
+            result = fut.result()
+            if cache:
+                cache.store(f, st, qhash, *result, use_exiftool=use_exiftool)
+        return Item(f, *result)
+
+    for f in files:
+        st = f.stat()
+        hit, result, qhash = cache.cached(f, st, use_exiftool) if cache else (False, None, None)
+        fut = None if hit else pool.submit(rename_script.get_capture_dt, f, use_exiftool)
+        pending.append((f, st, qhash, fut, result))
+        while pending and (len(pending) > window or pending[0][3] is None or pending[0][3].done()):
+            yield pop()
+    while pending:
+        yield pop()
+
+class Renamer:
+    """Streaming version of rename_script's planner: one taken-set and counter dict per folder."""
+
+    def __init__(self, pattern: str, dry: bool, cache=None):
+        self.pattern = pattern
+        self.dry = dry
+        self.cache = cache
+        self.taken: Dict[Path, set] = {}
+        self.counters: Dict[Path, dict] = {}
+        self.count = 0
+
+    def __call__(self, f: Path, dt: datetime) -> Path:
+        if rename_script.already_named(f.name, dt, self.pattern):
+            return f
+        d = f.parent
+        # Every existing name stays reserved, so a target never names another file (no chains)
+        taken = self.taken.setdefault(d, {x.name.lower() for x in d.iterdir() if x.is_file()})
+        name = rename_script.build_target_name(dt, f.suffix, taken, self.pattern, self.counters.setdefault(d, {}))
+        dst = d / name
+        if dst == f:
+            return f
+        if self.dry:
+            print(f"[DRY] {f}  ->  {dst}", file=sys.stderr)
+        else:
+            if dst.exists():
+                raise FileExistsError(f"refusing to overwrite {dst}")
+            f.rename(dst)
+            if self.cache:
+                self.cache.moved(f, dst)
+            print(f"Renamed: {f.name} -> {dst.name}", file=sys.stderr)
+        self.count += 1
+        return dst
+
+    def reserve(self, f: Path):
+        """Keep a name that appeared after the folder was first listed out of future targets."""
+        if f.parent in self.taken:
+            self.taken[f.parent].add(f.name.lower())
+
+def process_media(path: Path, spec: heic_convert.OutputSpec, srgb: bool, root: Path,
+                  derivatives: Optional[Path], widths: List[int], dry: bool) -> dict:
+    """Process-pool stage: HEIC -> JPEG, then width variants of the resulting image."""
+    out = {"image": str(path), "msgs": [], "converted": False}
+    try:
+        if path.suffix.lower() in HEIC_EXTS:
+            dst = path.with_name(heic_convert.output_name(path.stem, spec))
+            msg = heic_convert.convert_one(path, [(dst, spec)], srgb, False, dry)
+            out["msgs"].append(msg)
+            out["converted"] = not msg.startswith("SKIP")
+            out["image"] = str(dst)
+        image = Path(out["image"])
+        if derivatives and image.suffix.lower() in make_derivatives.DEFAULT_EXTS and not dry:
+            written = make_derivatives.make_variants(image, image.relative_to(root), derivatives, widths, 80)
+            if written:
+                out["msgs"].append(f"{image.name}: {len(written)} variant(s)")
+    except Exception as e:
+        out["msgs"].append(f"ERROR: {path.name}: {e}")
+        out["error"] = True
+    return out
+
+def group_by_capture_day(images: List[tuple]) -> Dict[str, List[Path]]:
+    """day -> paths from (path, capture dt) pairs; day and in-day order come from the capture time."""
+    groups: Dict[str, List[Path]] = defaultdict(list)
+    order = {}
+    for image, dt in images:
+        try:
+            day = dt.strftime("%Y-%m-%d") if dt else entries.parse_day_from_stem(image.stem)
+        except ValueError:
+            continue
+        groups[day].append(image)
+        order[image] = (dt or datetime.min, entries.natural_key(image.name))
+    for day in groups:
+        groups[day].sort(key=order.__getitem__)
+    return groups
+
+def main():
+    ap = argparse.ArgumentParser(description="Import photos in one pass: date -> rename -> convert -> entries.")
+    ap.add_argument("folder", help="Folder to import (e.g. ./foto)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Process subfolders")
+    ap.add_argument("--dry-run", action="store_true", help="Show planned changes only")
+    # rename_script.py
+    ap.add_argument("--pattern", default="%Y-%m-%d_%H%M%S", help="strftime pattern for filename stem (default: %(default)s)")
+    ap.add_argument("--recent-days", type=int, default=rename_script.DEFAULT_RECENT_DAYS,
+                    help="Don't rename files whose metadata date is within the last N days (default: %(default)s; 0 disables)")
+    ap.add_argument("--allow-mtime", action="store_true", help="Fall back to file mtime when no metadata date is available")
+    ap.add_argument("--no-exiftool", action="store_true", help="Use only the built-in EXIF/QuickTime reader")
+    ap.add_argument("--cache", default=str(rename_script.DEFAULT_CACHE), help="Capture-date cache (default: %(default)s)")
+    ap.add_argument("--no-cache", action="store_true", help="Don't use the capture-date cache")
+    # heic_convert.py
+    ap.add_argument("--to", choices=sorted(heic_convert.LABELS), default="jpg", help="HEIC output format (default: jpg)")
+    ap.add_argument("--quality", type=int, default=92, help="JPEG/WebP quality 1-100 (default: 92)")
+    ap.add_argument("--srgb", action="store_true", help="Convert colors to sRGB for maximum compatibility")
+    ap.add_argument("--delete-original", action="store_true", help="Delete .HEIC after successful conversion")
+    ap.add_argument("-j", "--jobs", type=int, default=0, help="Decode/encode worker processes (default: all cores)")
+    ap.add_argument("--io-threads", type=int, default=8, help="Threads reading capture dates (default: 8)")
+    # make_derivatives.py
+    ap.add_argument("--derivatives", default="", help="Also write width variants here (see make_derivatives.py)")
+    ap.add_argument("--derivatives-url", default="./derivatives", help="Prefix for derivative URLs in srcset")
+    # create_entries.py
+    ap.add_argument("--base-url", default="./foto", help="Prefix for image src (default: ./foto)")
+    ap.add_argument("--sender", required=True, help="data-sender value")
+    ap.add_argument("--symbol", required=True, help="data-symbol value")
+    ap.add_argument("--no-meta", action="store_true", help="Don't emit width/height and placeholder attributes")
+    ap.add_argument("--meta-cache", default=str(META_CACHE), help="Image size/placeholder cache (default: %(default)s)")
+    ap.add_argument("--out", default="", help="Write the HTML entries to this file instead of stdout")
+    ap.add_argument("--update", default="", help="Splice new figures into this page (see update_entries.py)")
+    ap.add_argument("--known", action="append",
+                    help="Other files whose srcs count as already published (repeatable, default: ./entries)")
+    ap.add_argument("--manifest", default="", help="Merge entries into this JSON manifest dir (see manifest.py)")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        sys.exit("Path is not a folder.")
+    if not args.no_exiftool:
+        rename_script.ensure_exiftool()
+    if (root / rename_script.JOURNAL_NAME).exists():
+        sys.exit("Interrupted rename batch found; run rename_script.py --resume or --rollback first.")
+
+    use_exiftool = not args.no_exiftool
+    cache = None if args.no_cache else rename_script.DateCache(Path(args.cache).expanduser())
+    spec = heic_convert.OutputSpec(args.to, args.quality, None)
+    derivatives = Path(args.derivatives).expanduser().resolve() if args.derivatives else None
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    now = datetime.now()
+    cutoff = now - timedelta(days=max(args.recent_days, 0))
+    rename = Renamer(args.pattern, args.dry_run, cache)
+    skipped_missing = skipped_recent = 0
+    when: Dict[str, Optional[datetime]] = {}
+
+    files = sorted(rename_script.iter_files(root, args.recursive))  # the only walk
+
+    def renamed() -> Iterator[tuple]:
+        nonlocal skipped_missing, skipped_recent
+        with ThreadPoolExecutor(max_workers=max(1, args.io_threads)) as pool:
+            for item in dated_items(files, pool, 4 * max(1, args.io_threads), cache, use_exiftool):
+                f, dt = item.path, item.dt
+                if dt is None and args.allow_mtime:
+                    dt = datetime.fromtimestamp(f.stat().st_mtime)
+                if dt is None:
+                    skipped_missing += 1
+                elif args.recent_days > 0 and cutoff <= dt <= now:
+                    skipped_recent += 1
+                else:
+                    try:
+                        f = rename(f, dt)
+                    except Exception as e:
+                        print(f"FAILED: {f}  ({e})", file=sys.stderr)
+                when[str(f)] = dt
+                if f.suffix.lower() in HEIC_EXTS or (derivatives and f.suffix.lower() in make_derivatives.DEFAULT_EXTS):
+                    yield f, (spec, args.srgb, root, derivatives, list(make_derivatives.DEFAULT_WIDTHS), args.dry_run)
+                elif f.suffix.lower() in entries.DEFAULT_EXTS:
+                    images.append((f, dt))
+
+    images: List[tuple] = []
+    made = 0
+    for src, res in heic_convert.run_jobs(renamed(), workers, 2 * workers, fn=process_media):
+        for msg in res["msgs"]:
+            print(msg, file=sys.stderr)
+        if res["converted"]:
+            made += 1
+            if args.delete_original and not args.dry_run:
+                try:
+                    os.remove(src)
+                    print(f"Deleted original: {src}", file=sys.stderr)
+                except Exception as e:
+                    print(f"Failed to delete {src}: {e}", file=sys.stderr)
+        image = Path(res["image"])
+        if image.suffix.lower() in entries.DEFAULT_EXTS:
+            images.append((image, when.get(str(src))))
+    if cache:
+        cache.close()
+
+    groups = group_by_capture_day(images)
+
+    print(f"\n{'Would rename' if args.dry_run else 'Renamed'} {rename.count}, "
+          f"{'would convert' if args.dry_run else 'converted'} {made} file(s).", file=sys.stderr)
+    if skipped_missing:
+        print(f"Not renamed (no metadata date): {skipped_missing}", file=sys.stderr)
+    if skipped_recent:
+        print(f"Not renamed (within last {args.recent_days} days): {skipped_recent}", file=sys.stderr)
+    if not groups:
+        print("No entries to emit.", file=sys.stderr)
+        return
+
+    # A dry run names files that don't exist yet: nothing to read sizes from
+    meta = None if args.no_meta or args.dry_run else MetaCache(Path(args.meta_cache).expanduser())
+    if args.update:
+        known_files = args.known if args.known is not None else default_known()
+        added = update_target(Path(args.update), groups, root, args.base_url, args.sender, args.symbol, known_files,
+                              derivatives=derivatives, derivatives_url=args.derivatives_url,
+                              dry=args.dry_run, meta=meta)
+        print(f"{'Would add' if args.dry_run else 'Added'} {sum(map(len, added.values()))} figure(s) to {args.update}",
+              file=sys.stderr)
+    elif args.manifest:
+        days = entries.build_manifest(groups, args.base_url, root, args.sender, args.symbol,
+                                      derivatives=derivatives, derivatives_url=args.derivatives_url, meta=meta)
+        if not args.dry_run:
+            written = write_manifest(Path(args.manifest).expanduser(), days)
+            print(f"Manifest: {len(written)} month shard(s) updated in {args.manifest}", file=sys.stderr)
+    else:
+        html_out = entries.build_entries(groups, args.base_url, root, args.sender, args.symbol,
+                                         derivatives=derivatives, derivatives_url=args.derivatives_url, meta=meta)
+        if args.out:
+            Path(args.out).write_text(html_out, encoding="utf-8")
+            print(f"Wrote {args.out}", file=sys.stderr)
+        else:
+            print(html_out)
+    if meta:
+        meta.close()
+
+if __name__ == "__main__":
+    main()
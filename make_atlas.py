@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Pack each month's calendar-cell thumbnails into one sprite atlas, so the page shows
+a month with one image request and one decode instead of an <img> per photo.
+- Days come from gallery_entries.group_by_day() (the build_entries grouping);
+  one atlas per month: atlas/YYYY-MM.<hash>.webp (or .jpg) + atlas/YYYY-MM.json.
+- Every photo gets a slot of --tile pixels (default 320x240, i.e. a 160px cell at
+  2x); the thumbnail keeps its aspect ratio inside the slot, 2px apart so tiles
+  don't bleed into each other when the browser scales them.
+- YYYY-MM.json: {"img", "w", "h", "tiles": {"foto/2024-04-25_1.jpg": [x, y, w, h]},
+  "sources": {...}}. Tiles are keyed like captions.caption_key(), which is what the
+  page's chiaveFoto() produces for an entry's src.
+- Incremental: a month is rebuilt only when its photos (path/size/mtime) or the
+  tile settings changed; atlases of months without photos are removed. The image
+  name carries a content hash, so it can be cached forever.
+
+Usage:
+  python3 make_atlas.py ./foto -r
+  python3 make_atlas.py ./foto -r --out ./atlas --format jpg --tile 240x180 -j 4
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+from collections import defaultdict
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import heic_convert
+import perf
+from captions import caption_key
+from gallery_io import atomic_write_bytes, atomic_write_text
+from gallery_entries import DEFAULT_EXTS, collect_files, group_by_day
+
+VERSION = 1
+GAP = 2  # px between slots
+FORMATS = {"webp": ("WEBP", 75), "jpg": ("JPEG", 80)}
+
+def parse_tile(s: str) -> Tuple[int, int]:
+    try:
+        w, h = (int(v) for v in s.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT, e.g. 320x240")
+    return w, h
+
+def source_state(items: List[Tuple[str, Path]]) -> Dict[str, list]:
+    state = {}
+    for key, p in items:
+        st = p.stat()
+        state[key] = [st.st_size, st.st_mtime_ns]
+    return state
+
+@perf.timed("atlas", profile=True)
+def build_atlas(month: str, items: List[Tuple[str, Path]], out_dir: Path, tile: Tuple[int, int],
+                fmt: str, quality: int) -> dict:
+    """Decode, shrink and paste every photo of the month; write the image, return its map."""
+    from PIL import Image, ImageOps
+
+    tw, th = tile
+    cols = max(1, math.ceil(math.sqrt(len(items))))
+    rows = math.ceil(len(items) / cols)
+    sheet = Image.new("RGB", (cols * (tw + GAP) - GAP, rows * (th + GAP) - GAP), (0, 0, 0))
+    tiles = {}
+    for i, (key, p) in enumerate(items):
+        x, y = (i % cols) * (tw + GAP), (i // cols) * (th + GAP)
+        try:
+            with Image.open(p) as im:
+                im.draft("RGB", (max(tile),) * 2)  # JPEG: decode at 1/2..1/8 scale
+                thumb = ImageOps.exif_transpose(im)
+                if thumb.mode != "RGB":
+                    thumb = thumb.convert("RGB")
+                thumb.thumbnail(tile, Image.LANCZOS, reducing_gap=2.0)
+        except Exception as e:
+            print(f"ERROR: {p.name}: {e}")
+            continue
+        sheet.paste(thumb, (x, y))
+        tiles[key] = [x, y, thumb.width, thumb.height]
+
+    pil_fmt = FORMATS[fmt][0]
+    buf = BytesIO()
+    with perf.stage("save", month) as span:
+        if pil_fmt == "WEBP":
+            sheet.save(buf, format=pil_fmt, quality=quality, method=4)
+        else:
+            sheet.save(buf, format=pil_fmt, quality=quality, optimize=True, progressive=True)
+        span.written = buf.tell()
+    data = buf.getvalue()
+    name = f"{month}.{hashlib.blake2b(data, digest_size=16).hexdigest()[:10]}.{fmt}"
+    atomic_write_bytes(out_dir / name, data)
+    return {"img": name, "w": sheet.width, "h": sheet.height, "tiles": tiles}
+
+def _build_safe(month: str, *args):
+    try:
+        return build_atlas(month, *args)
+    except Exception as e:
+        return {"error": f"{month}: {e}"}
+
+def main():
+    ap = argparse.ArgumentParser(description="Build per-month sprite atlases of the calendar cell thumbnails.")
+    ap.add_argument("folder", help="Folder with images (e.g. ./foto)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Scan subfolders too")
+    ap.add_argument("--ext", action="append", help="Extra extension(s) to include (repeatable)")
+    ap.add_argument("--base-url", default="./foto", help="Prefix for image src, as in the entries (default: ./foto)")
+    ap.add_argument("--out", default="./atlas", help="Output directory (default: ./atlas)")
+    ap.add_argument("--tile", type=parse_tile, default=(320, 240), help="Slot size per photo (default: 320x240)")
+    ap.add_argument("--format", choices=sorted(FORMATS), default="webp", help="Atlas format (default: webp)")
+    ap.add_argument("--quality", type=int, default=0, help="Encoder quality (default: 75 webp, 80 jpg)")
+    ap.add_argument("--force", action="store_true", help="Rebuild every month")
+    ap.add_argument("--dry-run", action="store_true", help="List the months that would be rebuilt")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="Parallel worker processes (default: 1; 0 = all cores)")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit("Path is not a folder.")
+    out_dir = Path(args.out).expanduser().resolve()
+    quality = args.quality or FORMATS[args.format][1]
+    settings = {"tile": list(args.tile), "format": args.format, "quality": quality}
+
+    exts = list(DEFAULT_EXTS) + ["." + e.lower().lstrip(".") for e in (args.ext or [])]
+    groups, skipped = group_by_day(collect_files(root, args.recursive, exts))
+    base = args.base_url.rstrip("/")
+    months: Dict[str, List[Tuple[str, Path]]] = defaultdict(list)
+    for day in sorted(groups):
+        for p in groups[day]:
+            rel = p.relative_to(root).as_posix()
+            months[day[:7]].append((caption_key(f"{base}/{rel}" if base else rel), p))
+
+    todo, maps = [], {}
+    for month, items in sorted(months.items()):
+        state = source_state(items)
+        json_path = out_dir / f"{month}.json"
+        try:
+            old = json.loads(json_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            old = None
+        fresh = (old and old.get("v") == VERSION and old.get("sources") == state
+                 and all(old.get(k) == v for k, v in settings.items()) and (out_dir / old["img"]).is_file())
+        if fresh and not args.force:
+            continue
+        maps[month] = (old, state)
+        todo.append((month, items))
+
+    stale = [p for p in out_dir.glob("*.json") if p.stem not in months] if out_dir.is_dir() else []
+    if args.dry_run:
+        for month, items in todo:
+            print(f"[DRY] {month}: {len(items)} photo(s)")
+        for p in stale:
+            print(f"[DRY] remove {p.name}")
+        print(f"\n[DRY] {len(todo)} of {len(months)} month(s) would be rebuilt.")
+        return
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    jobs = ((month, (items, out_dir, args.tile, args.format, quality)) for month, items in todo)
+    built = 0
+    for month, res in heic_convert.run_jobs(jobs, workers, 2 * workers, fn=_build_safe):
+        if "error" in res:
+            print(f"ERROR: {res['error']}")
+            continue
+        old, state = maps[month]
+        atomic_write_text(out_dir / f"{month}.json", json.dumps(
+            {"v": VERSION, **res, **settings, "sources": state}, ensure_ascii=False, separators=(",", ":")))
+        if old and old.get("img") and old["img"] != res["img"]:
+            (out_dir / old["img"]).unlink(missing_ok=True)
+        built += 1
+        print(f"{month}: {len(res['tiles'])} tile(s), {res['w']}x{res['h']} -> {res['img']}")
+
+    for p in stale:
+        try:
+            img = json.loads(p.read_text(encoding="utf-8")).get("img")
+        except ValueError:
+            img = None
+        if img:
+            (out_dir / img).unlink(missing_ok=True)
+        p.unlink()
+        print(f"Removed {p.name}")
+
+    print(f"\nDone. Rebuilt {built} of {len(months)} month(s)"
+          + (f", {len(skipped)} file(s) without a date skipped." if skipped else "."))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Generate fixed-width derivatives of the gallery photos for srcset.
+- For every image writes <name>-<width>.webp and <name>-<width>.jpg (name keeps the
+  source extension, so foo.jpg and foo.png don't share variants) into a cache dir
+  that mirrors the source tree (default: ./derivatives next to ./foto).
+- Decodes each source once (JPEG draft mode) and downsizes largest -> smallest.
+- Never upscales: widths >= the original width are skipped, the original covers them
+  (the generators list it as the largest srcset candidate).
+- Skips variants that are newer than their source and complete, so re-runs only
+  touch new photos.
+- Each variant is encoded to a hidden .part file and renamed into place
+  (gallery_io.save_durable), so an interrupted run never leaves a truncated variant
+  that a later run would take as up to date.
+
+Usage:
+  python3 make_derivatives.py ./foto -r
+  python3 make_derivatives.py ./foto -r --out ./derivatives --width 160 --width 480
+"""
+
+import argparse
+from pathlib import Path
+from typing import List, Sequence
+
+import perf
+from gallery_io import output_complete, save_durable
+
+DEFAULT_EXTS = {".jpg", ".jpeg", ".png"}
+DEFAULT_WIDTHS = (160, 480, 1280)
+FORMATS = ((".webp", "WEBP"), (".jpg", "JPEG"))
+
+def variant_path(out_root: Path, rel: Path, width: int, ext: str) -> Path:
+    """Where the `width` px variant of foto/<rel> lives, e.g. derivatives/a/b.jpg-480.webp."""
+    return out_root / rel.parent / f"{rel.name}-{width}{ext}"
+
+def existing_variants(out_root: Path, rel: Path, ext: str, widths: Sequence[int] = DEFAULT_WIDTHS) -> List[int]:
+    """Widths that have actually been generated for foto/<rel> (smaller originals have fewer)."""
+    return [w for w in widths if variant_path(out_root, rel, w, ext).is_file()]
+
+def is_fresh(dst: Path, src_mtime: float) -> bool:
+    try:
+        if dst.stat().st_mtime < src_mtime:
+            return False
+    except FileNotFoundError:
+        return False
+    return output_complete(dst)  # a truncated file from an older, non-atomic run is redone
+
+@perf.timed("derivatives", read=perf.file_size, profile=True)
+def make_variants(src: Path, rel: Path, out_root: Path, widths: Sequence[int], quality: int,
+                  force: bool = False, dry: bool = False) -> List[Path]:
+    """Write the missing/stale variants of one image, return the paths written."""
+    # Pillow is only needed here; entry generators import this module for the paths
+    from PIL import Image, ImageOps
+
+    src_mtime = src.stat().st_mtime
+    written = []
+    with Image.open(src) as im:
+        # Header only so far: work out the displayed width before deciding to decode
+        ow, oh = im.size
+        if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            ow, oh = oh, ow
+        todo = [
+            (w, ext, fmt)
+            for w in sorted(widths, reverse=True) if w < ow
+            for ext, fmt in FORMATS
+            if force or not is_fresh(variant_path(out_root, rel, w, ext), src_mtime)
+        ]
+        if not todo:
+            return written
+
+        # Let the JPEG decoder downscale by 1/2../1/8 while decoding
+        im.draft("RGB", (max(w for w, _, _ in todo),) * 2)
+        cur = ImageOps.exif_transpose(im)
+        if cur.mode not in ("RGB", "L"):
+            cur = cur.convert("RGB")
+        for w in sorted({w for w, _, _ in todo}, reverse=True):
+            h = max(1, round(oh * w / ow))
+            # Resize from the previous (larger) step: cheaper than from the full image
+            cur = cur.resize((w, h), Image.LANCZOS, reducing_gap=3.0)
+            for tw, ext, fmt in todo:
+                if tw != w:
+                    continue
+                dst = variant_path(out_root, rel, w, ext)
+                if not dry:
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    if fmt == "JPEG":
+                        save_durable(cur, dst, dict(format=fmt, quality=quality, optimize=True, progressive=True))
+                    else:
+                        save_durable(cur, dst, dict(format=fmt, quality=quality, method=4))
+                written.append(dst)
+    return written
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate fixed-width WebP/JPEG derivatives for srcset.")
+    ap.add_argument("folder", help="Folder with original images (e.g. ./foto)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Scan subfolders too")
+    ap.add_argument("--out", default="", help="Derivative cache dir (default: <folder>/../derivatives)")
+    ap.add_argument("--width", type=int, action="append", help="Variant width in px (repeatable, default: 160/480/1280)")
+    ap.add_argument("--quality", type=int, default=80, help="WebP/JPEG quality (default: 80)")
+    ap.add_argument("--force", action="store_true", help="Regenerate even if variants are up to date")
+    ap.add_argument("--dry-run", action="store_true", help="Show what would be written")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit("Path is not a folder.")
+    out_root = Path(args.out).expanduser().resolve() if args.out else root.parent / "derivatives"
+    widths = args.width or list(DEFAULT_WIDTHS)
+
+    pattern = root.rglob("*") if args.recursive else root.iterdir()
+    files = sorted(p for p in pattern if p.is_file() and p.suffix.lower() in DEFAULT_EXTS)
+
+    made = 0
+    for src in files:
+        rel = src.relative_to(root)
+        try:
+            written = make_variants(src, rel, out_root, widths, args.quality, args.force, args.dry_run)
+        except Exception as e:
+            print(f"ERROR: {rel}: {e}")
+            continue
+        if written:
+            made += len(written)
+            print(f"{rel}: {len(written)} variant(s)")
+
+    print(f"\nDone. {'Would write' if args.dry_run else 'Wrote'} {made} variant(s) for {len(files)} image(s).")
+
+if __name__ == "__main__":
+    main()
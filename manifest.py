@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Month-sharded JSON manifest for the calendar page.
+- manifest/index.json   : {"v": 1, "months": {"2024-04": {"25": 2, ...}}, "senders": [...]}
+- manifest/YYYY-MM.json : {"2024-04-25": [{"src", "sender", "symbol", "caption",
+                            "srcset"?, "w"?, "h"?, "color"?, "lqip"?}, ...]}
+The page loads index.json, then only the shard of the month on screen and its neighbours,
+so startup cost doesn't grow with the archive.
+
+Shards are merged by src: re-running a generator adds new photos and refreshes
+their srcset/size/placeholder, but never overwrites the caption/sender/symbol already in a shard.
+
+Usage (one-off migration of the markup already in index.html):
+  python3 manifest.py index.html --out ./manifest
+Generators write it directly:
+  python3 macos_create_entries.py ./foto --manifest ./manifest
+"""
+
+import argparse
+import html
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from gallery_io import DATA_OPEN_RE, FIGURE_RE, SECTION_RE, atomic_write_text
+
+INDEX_NAME = "index.json"
+VERSION = 1
+# Fields computed from the image itself; the rest is hand-editable
+DERIVED = ("srcset", "w", "h", "color", "lqip")
+
+ATTR_RE = re.compile(r'\b(data-sender|data-symbol)="([^"]*)"')
+IMG_RE = re.compile(r"<img\b[^>]*>")
+SRC_RE = re.compile(r'\bsrc="([^"]*)"')
+SRCSET_RE = re.compile(r'\bsrcset="([^"]*)"')
+IMG_META_RE = re.compile(r'\b(width|height|data-color|data-lqip)="([^"]*)"')
+WEBP_SOURCE_RE = re.compile(r'<source\b[^>]*type="image/webp"[^>]*>')
+CAPTION_RE = re.compile(r"<figcaption\b[^>]*>(.*?)</figcaption>", re.S)
+
+def dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+def load_json(path: Path, default):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return default
+
+def merge_day(old: List[dict], new: List[dict]) -> List[dict]:
+    """Keep existing order and hand-edited fields; refresh DERIVED fields; append unseen srcs."""
+    by_src = {e["src"]: dict(e) for e in old}
+    order = [e["src"] for e in old]
+    for e in new:
+        if e["src"] in by_src:
+            by_src[e["src"]].update((k, e[k]) for k in DERIVED if e.get(k))
+        else:
+            by_src[e["src"]] = dict(e)
+            order.append(e["src"])
+    return [by_src[s] for s in order]
+
+def write_manifest(out_dir: Path, days: Dict[str, List[dict]]) -> List[str]:
+    """Merge day -> entries into the shards and refresh index.json. Returns months written."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    by_month: Dict[str, Dict[str, List[dict]]] = defaultdict(dict)
+    for day, entries in days.items():
+        by_month[day[:7]][day] = entries
+
+    index = load_json(out_dir / INDEX_NAME, {"v": VERSION, "months": {}, "senders": []})
+    senders = set(index.get("senders", []))
+    written = []
+    for month in sorted(by_month):
+        path = out_dir / f"{month}.json"
+        shard = load_json(path, {})
+        for day, entries in by_month[month].items():
+            shard[day] = merge_day(shard.get(day, []), entries)
+        text = dumps(shard)
+        if not path.exists() or path.read_text(encoding="utf-8") != text:
+            atomic_write_text(path, text)
+            written.append(month)
+        index["months"][month] = {day[8:]: len(v) for day, v in sorted(shard.items())}
+        senders.update(e["sender"] for v in shard.values() for e in v if e.get("sender"))
+
+    index["v"] = VERSION
+    index["senders"] = sorted(senders)
+    atomic_write_text(out_dir / INDEX_NAME, dumps(index))
+    return written
+
+def parse_html_entries(text: str) -> Dict[str, List[dict]]:
+    """day -> manifest entries from <section data-date>/<figure> markup (inside #data if present)."""
+    m = DATA_OPEN_RE.search(text)
+    days: Dict[str, List[dict]] = defaultdict(list)
+    for sec in SECTION_RE.finditer(text, m.end() if m else 0):
+        for fig in FIGURE_RE.finditer(sec.group(2)):
+            block = fig.group(0)
+            img = IMG_RE.search(block)
+            src = SRC_RE.search(img.group(0)) if img else None
+            if not src:
+                continue
+            attrs = dict(ATTR_RE.findall(block))
+            webp = WEBP_SOURCE_RE.search(block)
+            srcset = SRCSET_RE.search(webp.group(0) if webp else img.group(0))
+            cap = CAPTION_RE.search(block)
+            entry = {
+                "src": html.unescape(src.group(1)),
+                "sender": html.unescape(attrs.get("data-sender", "")),
+                "symbol": html.unescape(attrs.get("data-symbol", "")),
+                "caption": html.unescape(re.sub(r"<[^>]+>", "", cap.group(1))).strip() if cap else "",
+            }
+            if srcset:
+                entry["srcset"] = html.unescape(srcset.group(1))
+            meta = dict(IMG_META_RE.findall(img.group(0)))
+            if meta.get("width", "").isdigit() and meta.get("height", "").isdigit():
+                entry.update(w=int(meta["width"]), h=int(meta["height"]))
+            if meta.get("data-color"):
+                entry["color"] = meta["data-color"]
+            if meta.get("data-lqip"):
+                entry["lqip"] = meta["data-lqip"]
+            days[sec.group(1)].append(entry)
+    return days
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the month-sharded JSON manifest from existing HTML entries.")
+    ap.add_argument("source", nargs="+", help="HTML file(s) with <section data-date> markup (index.html, entries)")
+    ap.add_argument("--out", default="./manifest", help="Manifest directory (default: ./manifest)")
+    args = ap.parse_args()
+
+    days: Dict[str, List[dict]] = defaultdict(list)
+    for src in args.source:
+        for day, entries in parse_html_entries(Path(src).read_text(encoding="utf-8")).items():
+            days[day] = merge_day(days[day], entries)
+    if not days:
+        raise SystemExit("No <section data-date> entries found.")
+
+    written = write_manifest(Path(args.out).expanduser(), days)
+    print(f"Wrote {len(written)} month shard(s), {sum(len(v) for v in days.values())} photo(s) to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Emit one timeline for several contributors: every (folder, sender, symbol) source
+is listed and sorted by capture time on its own thread, then the sorted sources are
+k-way merged (heapq.merge) and written day by day, so all senders' photos come out
+interleaved in shooting order in a single pass.
+- Capture time comes from the filename when it carries one (2024-04-25_153012.jpg,
+  as named by rename_script.py); date-only names (2024-04-25.jpg, 2024-04-25_2.jpg)
+  take the time of day from EXIF (cached, see rename_script.DateCache). The day is
+  always the filename's when it has one, as in (macos_)create_entries.py.
+- Untimed photos come first in their day, ties are broken by natural filename order.
+- Output is streamed: each source is read a day at a time (capture times included)
+  into a bounded queue, HTML sections are written as each day completes, --manifest
+  merges one month at a time into the shards. --out is written to a temp file and
+  renamed into place at the end, so a failed run leaves the previous file intact.
+- src URLs are --base-url + the path relative to --root, so sources can be
+  subfolders of the gallery (./foto/fra, ./foto/gege) or the same folder.
+- create_entries.py and macos_create_entries.py share this CLI for one source,
+  differing only in their default sender/symbol. By default they keep their
+  filename order (emit_by_filename(), no date cache); --capture-order makes them a
+  single-source run() of this merge.
+
+Usage:
+  python3 merge_entries.py --source ./foto/fra "Fra 🍐" "🍐" --source ./foto/gege "Gegè 👨🏻" "👨🏻" --out entries.html
+  python3 merge_entries.py --root ./foto -r --source ./foto/fra "Fra 🍐" "🍐" --source ./foto/gege "Gegè 👨🏻" "👨🏻" --manifest ./manifest
+"""
+
+import argparse
+import heapq
+import queue
+import re
+import sys
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import perf
+import rename_script
+from image_meta import DEFAULT_CACHE as META_CACHE, MetaCache
+from gallery_entries import (DEFAULT_EXTS, DEFAULT_SIZES, build_entries, build_figure, build_manifest,
+                             collect_files, group_by_day, natural_key)
+from gallery_io import atomic_open, atomic_write_text
+from manifest import write_manifest
+
+STAMP_RE = re.compile(r"^(\d{4})[-_](\d{2})[-_](\d{2})(?:[_ T-]?(\d{2})[-.:]?(\d{2})[-.:]?(\d{2})(?!\d))?")
+
+class Source(NamedTuple):
+    folder: Path
+    sender: str
+    symbol: str
+
+class Shot(NamedTuple):
+    day: str        # YYYY-MM-DD
+    time: str       # HH:MM:SS, "" if unknown
+    name_key: list  # natural_key(filename)
+    path: Path
+    source: int     # index into the sources list
+
+def stamp_from_name(stem: str) -> Tuple[Optional[str], str]:
+    """(day or None, time or '') from a YYYY-MM-DD[_HHMMSS] stem."""
+    m = STAMP_RE.match(stem)
+    if not m:
+        return None, ""
+    y, mo, d = int(m.group(1)), int(m.group(2)), int(m.group(3))
+    try:
+        datetime(y, mo, d)
+    except ValueError:
+        return None, ""
+    day = f"{y:04d}-{mo:02d}-{d:02d}"
+    if m.group(4) and int(m.group(4)) < 24 and int(m.group(5)) < 60 and int(m.group(6)) < 60:
+        return day, f"{m.group(4)}:{m.group(5)}:{m.group(6)}"
+    return day, ""
+
+def source_shots(index: int, src: Source, recursive: bool, exts: List[str], cache_path: Optional[Path],
+                 use_exiftool: bool, report_undated: bool = True) -> Iterator[Shot]:
+    """
+    One source's shots in (day, time, name) order, a day at a time. Only the file
+    names are listed up front (ordering by day needs them, and undated names are
+    placed by EXIF there); capture times are read, and shots built, one day at a time.
+    """
+    cache = rename_script.DateCache(cache_path) if cache_path else None  # sqlite: one connection per thread
+
+    def capture(p: Path) -> Optional[datetime]:
+        dt, _tag = cache.get(p, use_exiftool) if cache else rename_script.get_capture_dt(p, use_exiftool)
+        return dt
+
+    count = undated = 0
+    try:
+        listed = []  # (day, natural_key(name), path, time or "")
+        for p in collect_files(src.folder, recursive, exts):
+            day, time = stamp_from_name(p.stem)
+            if day is None:
+                dt = capture(p)
+                if dt is None:
+                    undated += 1
+                    continue
+                day, time = dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M:%S")
+            listed.append((day, natural_key(p.name), p, time))
+        listed.sort(key=lambda t: t[:2])
+        for day, group in groupby(listed, key=lambda t: t[0]):
+            shots = []
+            for _, name_key, p, time in group:
+                if not time:
+                    dt = capture(p)
+                    time = dt.strftime("%H:%M:%S") if dt else ""
+                shots.append(Shot(day, time, name_key, p, index))
+            shots.sort()
+            count += len(shots)
+            yield from shots
+    finally:
+        if cache:
+            cache.close()
+    print(f"{src.sender}: {count} photo(s) in {src.folder}"
+          + (f", {undated} without a date skipped" if undated and report_undated else ""), file=sys.stderr)
+
+def in_thread(make: Callable[[], Iterator], depth: int = 256) -> Iterator:
+    """Run the iterator make() returns on its own thread, at most `depth` items ahead of the consumer."""
+    q: "queue.Queue" = queue.Queue(depth)
+    stop = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def work():
+        it = make()
+        try:
+            for item in it:
+                if not put((None, item)):
+                    return
+            put((None, end))
+        except BaseException as e:
+            put((e, None))
+        finally:
+            it.close()  # on this thread: the sqlite cache must be closed where it was opened
+
+    t = threading.Thread(target=work, daemon=True)
+    t.start()
+    try:
+        while True:
+            err, item = q.get()
+            if err is not None:
+                raise err
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
+        t.join()
+
+def merged_days(sources: List[Source], recursive: bool, exts: List[str], cache_path: Optional[Path] = None,
+                use_exiftool: bool = False, report_undated: bool = True) -> Iterator[Tuple[str, List[Shot]]]:
+    """
+    Yield (day, shots) in day order across all sources, each day's shots in capture
+    order. Each source is read on its own thread, a bounded queue ahead of the merge,
+    so the first day comes out while later days are still being read.
+    """
+    streams = [in_thread(lambda i=i, s=s: source_shots(i, s, recursive, exts, cache_path, use_exiftool,
+                                                        report_undated))
+               for i, s in enumerate(sources)]
+    try:
+        for day, shots in groupby(heapq.merge(*streams), key=lambda s: s.day):
+            yield day, list(shots)
+    finally:
+        for st in streams:
+            st.close()
+
+def add_output_args(ap: argparse.ArgumentParser):
+    """Options shared with the single-source wrappers (create_entries.py, macos_create_entries.py)."""
+    ap.add_argument("--base-url", default="./foto", help="Prefix for image src (default: ./foto)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Scan subfolders too")
+    ap.add_argument("--ext", action="append", help="Extra extension(s) to include (repeatable)")
+    ap.add_argument("--exiftool", action="store_true", help="Ask exiftool for times the built-in reader can't find")
+    ap.add_argument("--cache", default=str(rename_script.DEFAULT_CACHE), help="Capture-date cache (default: %(default)s)")
+    ap.add_argument("--no-cache", action="store_true", help="Don't use the capture-date cache")
+    ap.add_argument("--out", default="", help="Write HTML to file instead of stdout")
+    ap.add_argument("--manifest", default="", help="Write/merge the month-sharded JSON manifest here instead of HTML")
+    ap.add_argument("--derivatives", default="", help="Derivative dir from make_derivatives.py")
+    ap.add_argument("--derivatives-url", default="./derivatives", help="Prefix for derivative URLs in srcset")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="sizes attribute for srcset (default: %(default)s)")
+    ap.add_argument("--no-meta", action="store_true", help="Don't emit width/height and placeholder attributes")
+    ap.add_argument("--meta-cache", default=str(META_CACHE), help="Image size/placeholder cache (default: %(default)s)")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
+
+def run(args: argparse.Namespace, sources: List[Source], root: Path, report_undated: bool = True) -> int:
+    """Merge sources and write HTML (--out/stdout) or the manifest (--manifest); returns the photo count."""
+    exts = list(DEFAULT_EXTS) + ["." + e.lower().lstrip(".") for e in (args.ext or [])]
+    if args.exiftool:
+        rename_script.ensure_exiftool()
+
+    cache_path = None if args.no_cache else Path(args.cache).expanduser()
+    derivatives = Path(args.derivatives).expanduser().resolve() if args.derivatives else None
+    meta = None if args.no_meta else MetaCache(Path(args.meta_cache).expanduser())
+    days = merged_days(sources, args.recursive, exts, cache_path, args.exiftool, report_undated)
+    count = 0
+    try:
+        if args.manifest:
+            out_dir = Path(args.manifest).expanduser()
+            months = 0
+            for month, month_days in groupby(days, key=lambda d: d[0][:7]):
+                shard: Dict[str, List[dict]] = {}
+                for day, shots in month_days:
+                    shard[day] = [build_manifest({day: [s.path]}, args.base_url, root,
+                                                 sources[s.source].sender, sources[s.source].symbol,
+                                                 derivatives, args.derivatives_url, meta)[day][0]
+                                  for s in shots]
+                    count += len(shots)
+                months += len(write_manifest(out_dir, shard))
+            print(f"Manifest: {count} photo(s), {months} month shard(s) updated in {args.manifest}", file=sys.stderr)
+            return count
+
+        # A failure half way leaves an existing --out file as it was
+        with (atomic_open(Path(args.out)) if args.out else nullcontext(sys.stdout)) as out:
+            for day, shots in days:
+                lines = [f'<section data-date="{day}">']
+                for s in shots:
+                    src = sources[s.source]
+                    fig = build_figure(s.path, day, args.base_url, root, src.sender, src.symbol,
+                                       derivatives, args.derivatives_url, args.sizes, meta)
+                    lines.extend("  " + line for line in fig)
+                lines.append("</section>")
+                out.write("\n".join(lines) + "\n")
+                count += len(shots)
+        if args.out:
+            print(f"Wrote {count} photo(s) to {args.out}", file=sys.stderr)
+        return count
+    finally:
+        days.close()  # stops the source threads if we bailed out early
+        if meta:
+            meta.close()
+
+def emit_by_filename(args: argparse.Namespace, root: Path):
+    """
+    The generators' default: day from the filename only, natural file order within a
+    day, no date cache; status lines on stdout as they always were.
+    """
+    exts = list(DEFAULT_EXTS) + ["." + e.lower().lstrip(".") for e in (args.ext or [])]
+    files = collect_files(root, args.recursive, exts)
+    if not files:
+        raise SystemExit("No matching image files found.")
+    groups, skipped = group_by_day(files)
+    if args.skip_nonmatching:
+        skipped = []
+    if not groups:
+        raise SystemExit("No filenames matched the expected pattern YYYY-MM-DD.*")
+
+    derivatives = Path(args.derivatives).expanduser().resolve() if args.derivatives else None
+    meta = None if args.no_meta else MetaCache(Path(args.meta_cache).expanduser())
+    try:
+        if args.manifest:
+            days = build_manifest(groups, args.base_url, root, args.sender, args.symbol,
+                                  derivatives=derivatives, derivatives_url=args.derivatives_url, meta=meta)
+            written = write_manifest(Path(args.manifest).expanduser(), days)
+            print(f"Manifest: {len(written)} month shard(s) updated in {args.manifest}")
+            if skipped:
+                print(f"Skipped {len(skipped)} non-matching file(s).")
+            return
+        html = build_entries(groups, args.base_url, root, args.sender, args.symbol, derivatives=derivatives,
+                             derivatives_url=args.derivatives_url, sizes=args.sizes, meta=meta)
+    finally:
+        if meta:
+            meta.close()
+    if args.out:
+        atomic_write_text(Path(args.out), html)
+        print(f"Wrote {args.out}")
+        if skipped:
+            print(f"Skipped {len(skipped)} non-matching file(s).")
+    else:
+        print(html)
+        if skipped:
+            print(f"\n<!-- Skipped {len(skipped)} non-matching file(s). -->")
+
+def single_source_main(sender: str, symbol: str):
+    """CLI of create_entries.py / macos_create_entries.py: one folder, one sender."""
+    ap = argparse.ArgumentParser(description="Emit HTML entries (or the manifest) for one folder of YYYY-MM-DD.* files.")
+    ap.add_argument("folder", help="Folder with images")
+    ap.add_argument("--sender", default=sender, help="data-sender value (default: %(default)s)")
+    ap.add_argument("--symbol", default=symbol, help="data-symbol value (default: %(default)s)")
+    ap.add_argument("--skip-nonmatching", action="store_true", help="Don't report files without a date")
+    ap.add_argument("--capture-order", action="store_true",
+                    help="Order each day by capture time (name, else EXIF via the date cache) as merge_entries.py "
+                         "does, and place undated names by EXIF; --exiftool/--cache/--no-cache apply only here")
+    add_output_args(ap)
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit("Path is not a folder.")
+    if not args.capture_order:
+        emit_by_filename(args, root)
+    elif not run(args, [Source(root, args.sender, args.symbol)], root, not args.skip_nonmatching):
+        raise SystemExit("No dated image files found (try --ext png or webp).")
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge several senders' folders into one capture-time-ordered timeline.")
+    ap.add_argument("--source", nargs=3, action="append", required=True, metavar=("FOLDER", "SENDER", "SYMBOL"),
+                    help="A contributor's folder with its data-sender/data-symbol (repeatable)")
+    ap.add_argument("--root", default="./foto", help="Gallery folder the src URLs are relative to (default: ./foto)")
+    add_output_args(ap)
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    root = Path(args.root).expanduser().resolve()
+    sources = []
+    for folder, sender, symbol in args.source:
+        f = Path(folder).expanduser().resolve()
+        if not f.is_dir():
+            raise SystemExit(f"Not a folder: {folder}")
+        if f != root and root not in f.parents:
+            raise SystemExit(f"{folder} is not inside --root {args.root}")
+        sources.append(Source(f, sender, symbol))
+    run(args, sources, root)
+
+if __name__ == "__main__":
+    main()
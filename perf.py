@@ -0,0 +1,290 @@
+"""
+Opt-in per-stage timing for the import scripts, to see where a slow run spends its
+time (exiftool, folder walks, HEIC decode, ICC conversion, encode, writes).
+- Hot functions are decorated with @timed("stage"), writes are wrapped in
+  `with stage("save") as s`. Disabled, each costs one flag check per call.
+- Per stage: calls, wall and CPU seconds, bytes read / written, and per-call latency
+  p50/p95/max plus a power-of-two histogram. CPU is the whole process's, so it
+  includes libheif's decoder threads but overlaps when stages run on a thread pool.
+  Stages nest: convert includes decode, srgb and save.
+- Work done in heic_convert.run_jobs() worker processes is shipped back with each
+  result and merged into the parent's numbers.
+- PICCOLAMIMI_PROFILE=N keeps cProfile output for the N slowest calls of the
+  stages marked profile=True (one per file: convert_one, make_variants).
+
+Enable with --perf FILE on a script (JSON report to FILE, summary on stderr), or
+PICCOLAMIMI_PERF=FILE for any of them; PICCOLAMIMI_PERF=1 prints the summary only.
+
+Usage:
+  python3 heic_convert.py ./foto --srgb --perf perf.json
+  PICCOLAMIMI_PERF=1 PICCOLAMIMI_PROFILE=5 python3 import_photos.py ./foto --sender "Fra 🍐" --symbol "🍐" --dry-run
+"""
+
+import atexit
+import cProfile
+import functools
+import heapq
+import inspect
+import io
+import json
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ENV = "PICCOLAMIMI_PERF"
+PROFILE_ENV = "PICCOLAMIMI_PROFILE"
+SLOWEST = 5          # slowest calls listed per stage
+PROFILE_LINES = 25   # functions kept per profile
+
+enabled = bool(os.environ.get(ENV))
+_profile_top = int(os.environ.get(PROFILE_ENV) or 0)
+_lock = threading.Lock()
+_stages: Dict[str, dict] = {}
+_profiles: List[tuple] = []  # min-heap of (seconds, stage, label, text)
+_started = time.perf_counter()
+
+def _reset_after_fork():
+    # A forked pool worker starts with the parent's numbers; it should only ship back its own
+    global _lock, _stages, _profiles
+    _lock, _stages, _profiles = threading.Lock(), {}, []
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _new_stage() -> dict:
+    return {"calls": 0, "wall": 0.0, "cpu": 0.0, "read": 0, "written": 0, "items": 0, "samples": [], "slowest": []}
+
+def _label(args) -> str:
+    return str(args[0]) if args and isinstance(args[0], (str, Path)) else ""
+
+def record(name: str, wall: float, cpu: float, read: int = 0, written: int = 0, items: int = 0, label: str = ""):
+    with _lock:
+        s = _stages.get(name)
+        if s is None:
+            s = _stages[name] = _new_stage()
+        s["calls"] += 1
+        s["wall"] += wall
+        s["cpu"] += cpu
+        s["read"] += read
+        s["written"] += written
+        s["items"] += items
+        s["samples"].append(wall)
+        entry = (wall, label)
+        if len(s["slowest"]) < SLOWEST:
+            heapq.heappush(s["slowest"], entry)
+        elif entry > s["slowest"][0]:
+            heapq.heapreplace(s["slowest"], entry)
+
+def _keep_profile(wall: float, name: str, label: str, prof: cProfile.Profile):
+    with _lock:
+        if len(_profiles) >= _profile_top and wall <= _profiles[0][0]:
+            return
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    with _lock:
+        entry = (wall, name, label, out.getvalue())
+        if len(_profiles) < _profile_top:
+            heapq.heappush(_profiles, entry)
+        elif wall > _profiles[0][0]:
+            heapq.heapreplace(_profiles, entry)
+
+class Span:
+    """Byte/item counts a `with stage()` block fills in."""
+    __slots__ = ("read", "written", "items")
+
+    def __init__(self):
+        self.read = self.written = self.items = 0
+
+@contextmanager
+def stage(name: str, label: str = ""):
+    if not enabled:
+        yield Span()
+        return
+    span = Span()
+    t0, c0 = time.perf_counter(), time.process_time()
+    try:
+        yield span
+    finally:
+        record(name, time.perf_counter() - t0, time.process_time() - c0, span.read, span.written, span.items, label)
+
+def timed(name: str, read: Optional[Callable] = None, written: Optional[Callable] = None, profile: bool = False):
+    """
+    Time every call of the decorated function. read(*args) and written(result) give
+    byte counts; generators are timed only while producing, and count items.
+    """
+    def deco(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                if not enabled:
+                    yield from fn(*args, **kwargs)
+                    return
+                wall = cpu = 0.0
+                items = 0
+                it = fn(*args, **kwargs)
+                try:
+                    while True:
+                        t0, c0 = time.perf_counter(), time.process_time()
+                        try:
+                            item = next(it)
+                        except StopIteration:
+                            return
+                        finally:
+                            wall += time.perf_counter() - t0
+                            cpu += time.process_time() - c0
+                        items += 1
+                        yield item
+                finally:
+                    record(name, wall, cpu, items=items, label=_label(args))
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            nread = read(*args) if read else 0
+            prof = None
+            if profile and _profile_top:
+                prof = cProfile.Profile()
+                try:
+                    prof.enable()
+                except ValueError:  # another thread is being profiled
+                    prof = None
+            t0, c0 = time.perf_counter(), time.process_time()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+                if prof:
+                    prof.disable()
+            items = len(result) if isinstance(result, (list, tuple, dict)) else 0
+            record(name, wall, cpu, nread, written(result) if written else 0, items, _label(args))
+            if prof:
+                _keep_profile(wall, name, _label(args), prof)
+            return result
+        return wrapper
+    return deco
+
+def file_size(path, *_args) -> int:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+# ---------- worker processes ----------
+
+def drain() -> dict:
+    """Take this process's numbers (and reset them), to send back to the parent."""
+    global _stages, _profiles
+    with _lock:
+        out = {"stages": _stages, "profiles": _profiles}
+        _stages, _profiles = {}, []
+    return out
+
+def merge(data: dict):
+    with _lock:
+        for name, theirs in data["stages"].items():
+            s = _stages.get(name)
+            if s is None:
+                s = _stages[name] = _new_stage()
+            for k in ("calls", "wall", "cpu", "read", "written", "items"):
+                s[k] += theirs[k]
+            s["samples"].extend(theirs["samples"])
+            s["slowest"] = heapq.nlargest(SLOWEST, s["slowest"] + theirs["slowest"])
+            heapq.heapify(s["slowest"])
+        for entry in data["profiles"]:
+            if len(_profiles) < _profile_top:
+                heapq.heappush(_profiles, entry)
+            elif entry[0] > _profiles[0][0]:
+                heapq.heapreplace(_profiles, entry)
+
+def call_and_drain(fn: Callable, *args):
+    """Process-pool shim: (fn(*args), drain())."""
+    return fn(*args), drain()
+
+# ---------- report ----------
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+def histogram(values: List[float]) -> Dict[str, int]:
+    """Calls per power-of-two millisecond bucket, keyed by the bucket's upper bound ('<=4ms')."""
+    buckets: Dict[int, int] = {}
+    for v in values:
+        ms = v * 1000
+        bound = 1 if ms <= 1 else 2 ** math.ceil(math.log2(ms))
+        buckets[bound] = buckets.get(bound, 0) + 1
+    return {f"<={b}ms": buckets[b] for b in sorted(buckets)}
+
+def report() -> dict:
+    with _lock:
+        stages = {}
+        for name, s in sorted(_stages.items()):
+            samples = sorted(s["samples"])
+            stages[name] = {
+                "calls": s["calls"],
+                "wall_s": round(s["wall"], 6),
+                "cpu_s": round(s["cpu"], 6),
+                "bytes_read": s["read"],
+                "bytes_written": s["written"],
+                "items": s["items"],
+                "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+                "max_ms": round(samples[-1] * 1000, 3) if samples else 0.0,
+                "histogram": histogram(samples),
+                "slowest": [{"ms": round(w * 1000, 3), "file": label}
+                            for w, label in sorted(s["slowest"], reverse=True)],
+            }
+        profiles = [{"stage": name, "file": label, "ms": round(w * 1000, 3), "stats": text}
+                    for w, name, label, text in sorted(_profiles, reverse=True)]
+    t = os.times()
+    return {
+        "script": Path(sys.argv[0]).name,
+        "argv": sys.argv[1:],
+        "elapsed_s": round(time.perf_counter() - _started, 3),
+        "cpu_s": round(t.user + t.system, 3),
+        "children_cpu_s": round(t.children_user + t.children_system, 3),
+        "stages": stages,
+        "profiles": profiles,
+    }
+
+def summary(rep: dict) -> str:
+    mb = 1024 * 1024
+    lines = [f"\n{rep['script']}: {rep['elapsed_s']:.2f}s elapsed, {rep['cpu_s']:.2f}s CPU"
+             + (f" (+{rep['children_cpu_s']:.2f}s in children)" if rep["children_cpu_s"] else ""),
+             f"  {'stage':<18}{'calls':>7}{'wall s':>9}{'cpu s':>8}{'MB in':>8}{'MB out':>8}"
+             f"{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"]
+    for name, s in sorted(rep["stages"].items(), key=lambda kv: -kv[1]["wall_s"]):
+        lines.append(f"  {name:<18}{s['calls']:>7}{s['wall_s']:>9.2f}{s['cpu_s']:>8.2f}"
+                     f"{s['bytes_read'] / mb:>8.1f}{s['bytes_written'] / mb:>8.1f}"
+                     f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['max_ms']:>9.1f}")
+        if s["calls"] > 1 and s["slowest"][0]["file"]:
+            lines.append(f"  {'':<18}slowest: {Path(s['slowest'][0]['file']).name} ({s['slowest'][0]['ms']:.0f} ms)")
+    for p in rep["profiles"]:
+        lines.append(f"\n--- profile: {p['stage']} {Path(p['file']).name} ({p['ms']:.0f} ms) ---\n{p['stats'].rstrip()}")
+    return "\n".join(lines)
+
+def setup(path: str = ""):
+    """Call first thing in main(): enables timing for --perf/PICCOLAMIMI_PERF and reports at exit."""
+    global enabled
+    path = path or os.environ.get(ENV, "")
+    if not path:
+        return
+    enabled = True
+    os.environ[ENV] = path  # worker processes started with spawn read it on import
+    target = None if path in ("1", "-") else Path(path).expanduser()
+
+    def dump():
+        rep = report()
+        if target:
+            target.write_text(json.dumps(rep, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(summary(rep) + (f"\nPerf report: {target}" if target else ""), file=sys.stderr)
+    atexit.register(dump)
@@ -1,28 +1,62 @@
 #!/usr/bin/env python3
 """
-Rename photos/videos by actual capture date using exiftool.
+Rename photos/videos by actual capture date.
 - Works with HEIC, JPG/JPEG, PNG, MOV, MP4.
 - Prefers: DateTimeOriginal (photos) -> MediaCreateDate (videos) -> CreateDate -> TrackCreateDate.
+- Reads EXIF (JPEG APP1, PNG eXIf, HEIF Exif item) and QuickTime atoms natively;
+  only files it can't parse go to a single long-lived `exiftool -stay_open` process.
 - Skips files with no metadata capture date.
 - Skips files whose metadata date is between today and N days ago (default N=5).
 - Falls back to file mtime ONLY if --allow-mtime is provided.
-- Adds -1, -2, ... if multiple files share the same second.
+- Caches resolved dates in SQLite keyed by path/size/mtime (inode or quick hash
+  after a rename), so re-runs only read new or changed files.
+- Adds -1, -2, ... if multiple files share the same second; files already named
+  after their own capture time are left alone.
+- Applies the batch in two phases (src -> temp -> final) with an on-disk journal,
+  so swaps/chains are safe and an interrupted run can be --resume'd or --rollback'ed.
 
 Usage:
   python3 rename_by_capture_time.py "/path/to/folder" -r --dry-run
   python3 rename_by_capture_time.py "/path/to/folder" -r
+  python3 rename_by_capture_time.py "/path/to/folder" -r --prune-cache
 """
 
 import argparse
+import atexit
+import hashlib
 import json
+import os
+import re
 import shutil
+import sqlite3
+import struct
 import subprocess
 import sys
-from datetime import datetime, timedelta
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+import perf
+from gallery_io import atomic_write_text
+
 VALID_EXTS = {".heic", ".jpg", ".jpeg", ".png", ".mov", ".mp4"}
 
+DATE_KEYS = ("DateTimeOriginal", "MediaCreateDate", "CreateDate", "TrackCreateDate")
+
+# EXIF tags we care about (IFD0 -> ExifIFD pointer, then the two capture dates)
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_CREATE_DATE = 0x9004  # "DateTimeDigitized", which exiftool calls CreateDate
+
+HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif"}
+QT_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+JOURNAL_NAME = ".rename_journal.json"
+DEFAULT_CACHE = Path.home() / ".cache" / "piccolamimi" / "capture_dates.sqlite"
+DEFAULT_RECENT_DAYS = 5  # shots this fresh may still be edited/shared under their camera name
+QUICK_HASH_CHUNK = 64 * 1024
+
 def ensure_exiftool():
     if shutil.which("exiftool") is None:
         sys.exit("exiftool not found. Install it first (macOS: brew install exiftool).")
@@ -53,44 +87,586 @@ def parse_dt_str(s: str):
             continue
     return None
 
-def get_dt_via_exiftool(path: Path):
-    """
-    Ask exiftool for capture date. QuickTimeUTC=1 corrects iPhone video quirks.
-    Preference order is applied below.
-    """
-    cmd = [
-        "exiftool", "-j", "-api", "QuickTimeUTC=1",
-        "-DateTimeOriginal", "-MediaCreateDate", "-CreateDate", "-TrackCreateDate",
-        str(path)
-    ]
+# ---------- native readers ----------
+
+def _tiff_dates(tiff: bytes) -> dict:
+    """Pull DateTimeOriginal/CreateDate out of a TIFF-structured EXIF blob."""
+    if tiff[:2] == b"II":
+        e = "<"
+    elif tiff[:2] == b"MM":
+        e = ">"
+    else:
+        return {}
+
+    def entries(off):
+        (n,) = struct.unpack_from(e + "H", tiff, off)
+        for i in range(n):
+            yield struct.unpack_from(e + "HHI4s", tiff, off + 2 + 12 * i)
+
+    def ascii_value(count, raw):
+        if count > 4:
+            (off,) = struct.unpack(e + "I", raw)
+            raw = tiff[off:off + count]
+        return raw[:count].split(b"\0")[0].decode("ascii", "replace")
+
+    out = {}
     try:
-        res = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        arr = json.loads(res.stdout)
-        if not arr:
+        (ifd0,) = struct.unpack_from(e + "I", tiff, 4)
+        exif_ifd = None
+        for tag, _typ, _count, raw in entries(ifd0):
+            if tag == TAG_EXIF_IFD:
+                (exif_ifd,) = struct.unpack(e + "I", raw)
+        if exif_ifd is None:
+            return out
+        for tag, typ, count, raw in entries(exif_ifd):
+            if typ != 2:  # ASCII
+                continue
+            if tag == TAG_DATETIME_ORIGINAL:
+                out["DateTimeOriginal"] = ascii_value(count, raw)
+            elif tag == TAG_CREATE_DATE:
+                out["CreateDate"] = ascii_value(count, raw)
+    except struct.error:
+        pass
+    return out
+
+def _jpeg_exif(f):
+    """Walk JPEG markers up to SOS and return the TIFF part of the APP1/Exif segment."""
+    f.seek(2)
+    while True:
+        hdr = f.read(4)
+        if len(hdr) < 4 or hdr[0] != 0xFF:
             return None
-        data = arr[0]
-    except Exception:
+        marker = hdr[1]
+        if marker in (0xD9, 0xDA):  # EOI / start of scan: no metadata past here
+            return None
+        (size,) = struct.unpack(">H", hdr[2:])
+        if marker == 0xE1:
+            data = f.read(size - 2)
+            if data.startswith(b"Exif\0\0"):
+                return data[6:]
+        else:
+            f.seek(size - 2, 1)
+
+def _png_exif(f):
+    """Return the eXIf chunk of a PNG, stopping at the first IDAT."""
+    f.seek(8)
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return None
+        size, ctype = struct.unpack(">I4s", hdr)
+        if ctype == b"eXIf":
+            return f.read(size)
+        if ctype in (b"IDAT", b"IEND"):
+            return None
+        f.seek(size + 4, 1)  # payload + CRC
+
+def _iter_boxes(f, start: int, end: int):
+    """Yield (type, payload_start, payload_end) for ISO-BMFF boxes in [start, end)."""
+    pos = start
+    while end is None or pos + 8 <= end:
+        f.seek(pos)
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return
+        size, btype = struct.unpack(">I4s", hdr)
+        payload = pos + 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", f.read(8))
+            payload += 8
+        elif size == 0:  # box runs to end of file
+            f.seek(0, 2)
+            size = f.tell() - pos
+        if size < payload - pos:
+            return
+        yield btype, payload, pos + size
+        pos += size
+
+def _find_box(f, start, end, btype):
+    for t, s, e in _iter_boxes(f, start, end):
+        if t == btype:
+            return s, e
+    return None
+
+def _heif_exif(f):
+    """Locate the 'Exif' item through meta/iinf + meta/iloc and return its TIFF blob."""
+    meta = _find_box(f, 0, None, b"meta")
+    if not meta:
+        return None
+    start, end = meta[0] + 4, meta[1]  # meta is a full box
+    exif_id = None
+    iinf = _find_box(f, start, end, b"iinf")
+    if iinf:
+        f.seek(iinf[0])
+        version = f.read(4)[0]
+        first = iinf[0] + 4 + (2 if version == 0 else 4)
+        for t, s, e in _iter_boxes(f, first, iinf[1]):
+            if t != b"infe":
+                continue
+            f.seek(s)
+            body = f.read(min(e - s, 16))
+            if body[0] < 2:
+                continue
+            if body[0] == 2:
+                item_id, item_type = struct.unpack_from(">H2x4s", body, 4)
+            else:
+                item_id, item_type = struct.unpack_from(">I2x4s", body, 4)
+            if item_type == b"Exif":
+                exif_id = item_id
+                break
+    if exif_id is None:
+        return None
+
+    iloc = _find_box(f, start, end, b"iloc")
+    if not iloc:
         return None
+    f.seek(iloc[0])
+    buf = f.read(iloc[1] - iloc[0])
+    version = buf[0]
+    off_size, len_size = buf[4] >> 4, buf[4] & 0x0F
+    base_size, idx_size = buf[5] >> 4, (buf[5] & 0x0F if version in (1, 2) else 0)
+    pos = 6
 
-    for key in ("DateTimeOriginal", "MediaCreateDate", "CreateDate", "TrackCreateDate"):
+    def take(n):
+        nonlocal pos
+        val = int.from_bytes(buf[pos:pos + n], "big") if n else 0
+        pos += n
+        return val
+
+    count = take(2 if version < 2 else 4)
+    for _ in range(count):
+        item_id = take(2 if version < 2 else 4)
+        method = take(2) & 0x0F if version in (1, 2) else 0
+        take(2)  # data_reference_index
+        base = take(base_size)
+        extents = []
+        for _ in range(take(2)):
+            take(idx_size)
+            extents.append((base + take(off_size), take(len_size)))
+        if item_id != exif_id:
+            continue
+        if method != 0:  # idat/item construction: leave it to exiftool
+            return None
+        data = b""
+        for off, length in extents:
+            f.seek(off)
+            data += f.read(length)
+        if len(data) < 4:
+            return None
+        (skip,) = struct.unpack(">I", data[:4])
+        return data[4 + skip:]
+    return None
+
+def _qt_time(f, payload_start):
+    """creation_time of an mvhd/tkhd/mdhd atom as a naive local datetime (QuickTimeUTC=1)."""
+    f.seek(payload_start)
+    head = f.read(12)
+    if len(head) < 12:
+        return None
+    if head[0] == 1:
+        (secs,) = struct.unpack(">Q", head[4:12])
+    else:
+        (secs,) = struct.unpack(">I", head[4:8])
+    if not secs:
+        return None
+    try:
+        return (QT_EPOCH + timedelta(seconds=secs)).astimezone().replace(tzinfo=None)
+    except (OverflowError, ValueError):
+        return None
+
+def _quicktime_dates(f) -> dict:
+    """moov/mvhd -> CreateDate, first trak's tkhd/mdhd -> TrackCreateDate/MediaCreateDate."""
+    moov = _find_box(f, 0, None, b"moov")
+    if not moov:
+        return {}
+    out = {}
+    for t, s, e in _iter_boxes(f, *moov):
+        if t == b"mvhd":
+            out["CreateDate"] = _qt_time(f, s)
+        elif t == b"trak" and "TrackCreateDate" not in out:
+            tkhd = _find_box(f, s, e, b"tkhd")
+            if tkhd:
+                out["TrackCreateDate"] = _qt_time(f, tkhd[0])
+            mdia = _find_box(f, s, e, b"mdia")
+            mdhd = _find_box(f, *mdia, b"mdhd") if mdia else None
+            if mdhd:
+                out["MediaCreateDate"] = _qt_time(f, mdhd[0])
+    return {k: v for k, v in out.items() if v}
+
+@perf.timed("dates.native")
+def read_native_dates(path: Path) -> dict:
+    """
+    Read capture-date tags without spawning anything. Container is sniffed from
+    the magic bytes, not the extension. Values are datetimes or EXIF strings.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(12)
+            if magic[:2] == b"\xff\xd8":
+                tiff = _jpeg_exif(f)
+            elif magic[:8] == b"\x89PNG\r\n\x1a\n":
+                tiff = _png_exif(f)
+            elif magic[4:8] == b"ftyp" and magic[8:12] in HEIF_BRANDS:
+                tiff = _heif_exif(f)
+            elif magic[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"):
+                return _quicktime_dates(f)
+            else:
+                return {}
+    except (OSError, struct.error, IndexError, ValueError):
+        return {}
+    return _tiff_dates(tiff) if tiff else {}
+
+def pick_dt(data: dict):
+    """Apply the tag precedence; return (datetime, tag) or (None, None)."""
+    for key in DATE_KEYS:
         val = data.get(key)
+        if isinstance(val, datetime):
+            return val, key
         if val:
             dt = parse_dt_str(val)
             if dt:
-                return dt
-    return None
+                return dt, key
+    return None, None
+
+# ---------- exiftool fallback ----------
+
+class ExiftoolBatch:
+    """One `exiftool -stay_open` process fed through stdin, reused for every query."""
+
+    def __init__(self):
+        self.proc = None
+        self.lock = threading.Lock()  # one request/response at a time on the pipe
+
+    def query(self, path: Path) -> dict:
+        with self.lock:
+            return self._query(path)
 
-def build_target_name(dt: datetime, ext: str, taken_lower: set, pattern: str):
+    def _query(self, path: Path) -> dict:
+        if self.proc is None:
+            self.proc = subprocess.Popen(
+                ["exiftool", "-stay_open", "True", "-@", "-"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                text=True, encoding="utf-8",
+            )
+        args = ["-j", "-api", "QuickTimeUTC=1", *(f"-{k}" for k in DATE_KEYS), str(path), "-execute"]
+        self.proc.stdin.write("\n".join(args) + "\n")
+        self.proc.stdin.flush()
+        out = []
+        for line in self.proc.stdout:
+            if line.strip() == "{ready}":
+                break
+            out.append(line)
+        else:
+            self.proc = None  # exiftool died; next query restarts it
+            return {}
+        arr = json.loads("".join(out) or "[]")
+        return arr[0] if arr else {}
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.write("-stay_open\nFalse\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+            self.proc = None
+
+_EXIFTOOL = None
+
+@perf.timed("exiftool", read=perf.file_size)
+def get_dt_via_exiftool(path: Path):
+    """
+    Ask exiftool for capture date; returns (dt, tag) like pick_dt(), or (None, None).
+    QuickTimeUTC=1 corrects iPhone video quirks. Uses one shared -stay_open process
+    instead of a process per file.
+    """
+    global _EXIFTOOL
+    if _EXIFTOOL is None:
+        _EXIFTOOL = ExiftoolBatch()
+        atexit.register(_EXIFTOOL.close)
+    try:
+        data = _EXIFTOOL.query(path)
+    except Exception:
+        return None, None
+    return pick_dt(data)
+
+def get_capture_dt(path: Path, use_exiftool: bool = True):
+    """Native reader first, exiftool for anything it couldn't resolve. Returns (dt, tag)."""
+    dt, key = pick_dt(read_native_dates(path))
+    if dt is None and use_exiftool:
+        dt, key = get_dt_via_exiftool(path)
+    return dt, key
+
+# ---------- persistent cache ----------
+
+def quick_hash(path: Path, size: int) -> str:
+    """Size + first/last 64 KiB: enough to recognise a moved or copied file."""
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(QUICK_HASH_CHUNK))
+        if size > 2 * QUICK_HASH_CHUNK:
+            f.seek(-QUICK_HASH_CHUNK, 2)
+            h.update(f.read(QUICK_HASH_CHUNK))
+    return h.hexdigest()
+
+class DateCache:
+    """
+    SQLite index of resolved capture dates. A row is valid while the file's
+    size and mtime match; after a rename it is found again by (dev, inode) or,
+    failing that, by quick content hash.
+    """
+
+    SCHEMA_VERSION = 2  # 2: tag is the exiftool tag the date came from
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            dev INTEGER,
+            inode INTEGER,
+            qhash TEXT,
+            dt TEXT,
+            tag TEXT
+        );
+        CREATE INDEX IF NOT EXISTS files_inode ON files (dev, inode);
+        CREATE INDEX IF NOT EXISTS files_qhash ON files (qhash);
+    """
+
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(self.SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            # Version 1 stored "exiftool" instead of the tag exiftool's date came from
+            self.db.execute("DELETE FROM files WHERE tag = 'exiftool'")
+            self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _row_to_result(row):
+        dt, tag = row
+        return (datetime.fromisoformat(dt) if dt else None), tag
+
+    def lookup(self, path: Path, st):
+        key = str(path)
+        row = self.db.execute(
+            "SELECT dt, tag FROM files WHERE path=? AND size=? AND mtime_ns=?",
+            (key, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if row:
+            return row
+        row = self.db.execute(
+            "SELECT path, dt, tag FROM files WHERE dev=? AND inode=? AND size=? AND mtime_ns=?",
+            (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if row:
+            self.moved(Path(row[0]), path)
+            return row[1:]
+        return None
+
+    def cached(self, path: Path, st, use_exiftool: bool = True):
+        """(hit, (dt, tag), qhash) without reading metadata; qhash is set on a miss."""
+        row = self.lookup(path, st)
+        if row is not None and (row[0] or not use_exiftool or row[1] == "exiftool-miss"):
+            self.hits += 1
+            return True, (self._row_to_result(row) if row[0] else (None, None)), None
+
+        qhash = quick_hash(path, st.st_size)
+        row = self.db.execute(
+            "SELECT dt, tag FROM files WHERE qhash=? AND size=? AND dt IS NOT NULL", (qhash, st.st_size)
+        ).fetchone()
+        if row:
+            self.hits += 1
+            result = self._row_to_result(row)
+            self.store(path, st, qhash, *result, use_exiftool=use_exiftool)
+            return True, result, qhash
+        self.misses += 1
+        return False, (None, None), qhash
+
+    def store(self, path: Path, st, qhash: str, dt, tag, use_exiftool: bool = True):
+        # Remember misses too, but only ones exiftool also gave up on
+        if dt is None:
+            tag = "exiftool-miss" if use_exiftool else None
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, dev, inode, qhash, dt, tag) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(path), st.st_size, st.st_mtime_ns, st.st_dev, st.st_ino, qhash,
+             dt.isoformat() if dt else None, tag),
+        )
+
+    def get(self, path: Path, use_exiftool: bool = True):
+        """Cached get_capture_dt(). Returns (dt, tag)."""
+        st = path.stat()
+        hit, result, qhash = self.cached(path, st, use_exiftool)
+        if hit:
+            return result
+        dt, tag = get_capture_dt(path, use_exiftool=use_exiftool)
+        self.store(path, st, qhash, dt, tag, use_exiftool)
+        return dt, tag
+
+    def moved(self, src: Path, dst: Path):
+        """Re-key a row after src.rename(dst)."""
+        self.db.execute("DELETE FROM files WHERE path=?", (str(dst),))
+        self.db.execute("UPDATE files SET path=? WHERE path=?", (str(dst), str(src)))
+
+    def moved_many(self, pairs):
+        """Re-key rows for a whole batch; chains (A->B, B->C) go through temp keys."""
+        pairs = [(str(a), str(b)) for a, b in pairs]
+        self.db.executemany("UPDATE files SET path=? WHERE path=?",
+                            [("\0" + b, a) for a, b in pairs])
+        self.db.executemany("DELETE FROM files WHERE path=?", [(b,) for _, b in pairs])
+        self.db.executemany("UPDATE files SET path=? WHERE path=?",
+                            [(b, "\0" + b) for _, b in pairs])
+
+    def prune(self, root: Path) -> int:
+        """Drop rows under root whose file is gone."""
+        prefix = str(root).rstrip(os.sep) + os.sep
+        gone = [
+            (p,) for (p,) in self.db.execute(
+                "SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+            )
+            if not os.path.exists(p)
+        ]
+        self.db.executemany("DELETE FROM files WHERE path=?", gone)
+        return len(gone)
+
+    def clear(self, root: Path) -> int:
+        prefix = str(root).rstrip(os.sep) + os.sep
+        cur = self.db.execute("DELETE FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+        return cur.rowcount
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def build_target_name(dt: datetime, ext: str, taken_lower: set, pattern: str, counters: dict = None):
+    """
+    Free name for dt in a directory: base, base-1, base-2, ...
+    With a per-directory `counters` dict the search resumes where the last file
+    with the same base stopped, so a burst of N same-second shots is O(N), not O(N^2).
+    """
     base = dt.strftime(pattern)
     ext_lc = ext.lower()
-    candidate = f"{base}{ext_lc}"
-    i = 1
-    while candidate.lower() in taken_lower:
-        candidate = f"{base}-{i}{ext_lc}"
+    key = f"{base}{ext_lc}".lower()
+    i = counters.get(key, 0) if counters is not None else 0
+    while True:
+        candidate = f"{base}-{i}{ext_lc}" if i else f"{base}{ext_lc}"
+        if candidate.lower() not in taken_lower:
+            break
         i += 1
+    if counters is not None:
+        counters[key] = i + 1
     taken_lower.add(candidate.lower())
     return candidate
 
+def already_named(name: str, dt: datetime, pattern: str) -> bool:
+    """True if name is base(-N).ext for this file's own capture time."""
+    stem, dot, ext = name.rpartition(".")
+    base = dt.strftime(pattern)
+    return bool(dot) and ext == ext.lower() and re.fullmatch(re.escape(base) + r"(-\d+)?", stem) is not None
+
+def plan_renames(resolved, pattern: str):
+    """
+    (src, dst) pairs for [(path, dt)]. Names of files that are themselves being
+    renamed count as free, so chains (A->B while B->C) and cycles are allowed;
+    apply_batch() takes care of applying them without clobbering anything.
+    """
+    by_dir = defaultdict(list)
+    for f, dt in resolved:
+        by_dir[f.parent].append((f, dt))
+
+    planned = []
+    for d, items in by_dir.items():
+        moving = {f.name.lower() for f, _ in items}
+        taken = {x.name.lower() for x in d.iterdir() if x.is_file()} - moving
+        counters = {}
+        # Files already named after their own capture time keep their name
+        keep = set()
+        for f, dt in items:
+            if already_named(f.name, dt, pattern) and f.name.lower() not in taken:
+                taken.add(f.name.lower())
+                keep.add(f)
+        for f, dt in items:
+            if f in keep:
+                continue
+            dst = d / build_target_name(dt, f.suffix, taken, pattern, counters)
+            if dst != f:
+                planned.append((f, dst))
+    return planned
+
+# ---------- journaled batch apply ----------
+
+def _journal_write(journal: Path, state: dict):
+    atomic_write_text(journal, json.dumps(state, ensure_ascii=False))
+
+def _move(a: Path, b: Path):
+    if b.exists():
+        raise FileExistsError(f"refusing to overwrite {b}")
+    a.rename(b)
+
+def apply_batch(planned, journal: Path, cache=None) -> int:
+    """
+    Two-phase rename: every src -> hidden temp name, then every temp -> dst.
+    The plan is journaled (fsynced) before phase 1 and marked before phase 2, so an
+    interrupted run can be finished with --resume or undone with --rollback.
+    """
+    run = f"{os.getpid()}-{int(datetime.now().timestamp())}"
+    entries = [
+        {"src": str(src), "tmp": str(src.parent / f".~rename-{run}-{i}.tmp"), "dst": str(dst)}
+        for i, (src, dst) in enumerate(planned)
+    ]
+    state = {"phase": 1, "entries": entries}
+    _journal_write(journal, state)
+    return _finish(journal, state, cache)
+
+def _finish(journal: Path, state: dict, cache=None) -> int:
+    if state["phase"] == 1:
+        for e in state["entries"]:
+            src, tmp = Path(e["src"]), Path(e["tmp"])
+            if src.exists() and not tmp.exists():
+                _move(src, tmp)
+        state["phase"] = 2
+        _journal_write(journal, state)
+    count = 0
+    for e in state["entries"]:
+        src, tmp, dst = Path(e["src"]), Path(e["tmp"]), Path(e["dst"])
+        if tmp.exists():
+            _move(tmp, dst)
+        if dst.exists():
+            count += 1
+            print(f"Renamed: {src.name} -> {dst.name}")
+    if cache:
+        cache.moved_many([(Path(e["src"]), Path(e["dst"])) for e in state["entries"]])
+    journal.unlink()
+    return count
+
+def resume_batch(journal: Path, cache=None) -> int:
+    """Finish an interrupted apply_batch() from its journal."""
+    return _finish(journal, json.loads(journal.read_text(encoding="utf-8")), cache)
+
+def rollback_batch(journal: Path) -> int:
+    """Put every file of an interrupted apply_batch() back under its original name."""
+    state = json.loads(journal.read_text(encoding="utf-8"))
+    if state["phase"] == 2:
+        # Only then can a dst name hold one of our files
+        for e in state["entries"]:
+            tmp, dst = Path(e["tmp"]), Path(e["dst"])
+            if not tmp.exists() and dst.exists():
+                _move(dst, tmp)
+    restored = 0
+    for e in state["entries"]:
+        src, tmp = Path(e["src"]), Path(e["tmp"])
+        if tmp.exists():
+            _move(tmp, src)
+            restored += 1
+    journal.unlink()
+    return restored
+
+@perf.timed("iter_files")
 def iter_files(root: Path, recursive: bool):
     if recursive:
         yield from (p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in VALID_EXTS)
@@ -98,7 +674,7 @@ def iter_files(root: Path, recursive: bool):
         yield from (p for p in root.iterdir() if p.is_file() and p.suffix.lower() in VALID_EXTS)
 
 def main():
-    ap = argparse.ArgumentParser(description="Rename photos/videos by capture date using exiftool.")
+    ap = argparse.ArgumentParser(description="Rename photos/videos by capture date.")
     ap.add_argument("folder", help="Folder to process")
     ap.add_argument("-r", "--recursive", action="store_true", help="Process subfolders")
     ap.add_argument("--dry-run", action="store_true", help="Show planned changes only")
@@ -111,35 +687,71 @@ def main():
     ap.add_argument(
         "--recent-days",
         type=int,
-        default=5,
-        help="Skip files whose metadata date is within the last N days (default: 5; use 0 to disable)."
+        default=DEFAULT_RECENT_DAYS,
+        help="Skip files whose metadata date is within the last N days (default: %(default)s; use 0 to disable)."
     )
     ap.add_argument(
         "--allow-mtime",
         action="store_true",
         help="If set, fall back to file mtime when no metadata date is available (otherwise skip)."
     )
+    ap.add_argument(
+        "--no-exiftool",
+        action="store_true",
+        help="Use only the built-in EXIF/QuickTime reader (files it can't parse are skipped)."
+    )
+    ap.add_argument("--cache", default=str(DEFAULT_CACHE), help="Capture-date cache file (default: %(default)s)")
+    ap.add_argument("--no-cache", action="store_true", help="Don't read or write the capture-date cache")
+    ap.add_argument("--rebuild-cache", action="store_true", help="Forget cached dates under the folder first")
+    ap.add_argument("--prune-cache", action="store_true", help="Drop cache rows for files that no longer exist")
+    ap.add_argument("--resume", action="store_true", help="Finish a batch interrupted mid-rename, then exit")
+    ap.add_argument("--rollback", action="store_true", help="Undo a batch interrupted mid-rename, then exit")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
     args = ap.parse_args()
+    perf.setup(args.perf)
 
-    ensure_exiftool()
+    if not args.no_exiftool:
+        ensure_exiftool()
 
     root = Path(args.folder).expanduser().resolve()
     if not root.exists() or not root.is_dir():
         sys.exit("Path is not a folder.")
 
+    cache = None if args.no_cache else DateCache(Path(args.cache).expanduser())
+
+    journal = root / JOURNAL_NAME
+    if args.resume or args.rollback:
+        if not journal.exists():
+            sys.exit(f"No interrupted batch in {root}.")
+        if args.rollback:
+            print(f"Rolled back {rollback_batch(journal)} file(s).")
+        else:
+            print(f"\nResumed. {resume_batch(journal, cache)} file(s) in place.")
+        if cache:
+            cache.close()
+        return
+    if journal.exists():
+        sys.exit(f"Interrupted batch found ({journal}). Run with --resume or --rollback first.")
+    if cache and args.rebuild_cache:
+        print(f"Cache: cleared {cache.clear(root)} row(s) under {root}")
+    if cache and args.prune_cache:
+        print(f"Cache: pruned {cache.prune(root)} stale row(s)")
+
     # For the recent window
     now = datetime.now()
     cutoff = now - timedelta(days=max(args.recent_days, 0))
 
-    # Track existing names per directory to avoid collisions
-    taken_map = {}
-    planned = []
+    resolved = []
 
     skipped_missing = 0
     skipped_recent = 0
 
     for f in sorted(iter_files(root, args.recursive)):
-        dt = get_dt_via_exiftool(f)
+        if cache:
+            dt, _tag = cache.get(f, use_exiftool=not args.no_exiftool)
+        else:
+            dt, _tag = get_capture_dt(f, use_exiftool=not args.no_exiftool)
         if dt is None:
             if args.allow_mtime:
                 dt = datetime.fromtimestamp(f.stat().st_mtime)
@@ -156,15 +768,13 @@ def main():
                 print(f"[SKIP recent {args.recent_days}d] {f}  ({dt.strftime('%Y-%m-%d %H:%M:%S')})")
             continue
 
-        d = f.parent
-        taken = taken_map.setdefault(
-            str(d),
-            {x.name.lower() for x in d.iterdir() if x.is_file()}
-        )
-        new_name = build_target_name(dt, f.suffix, taken, args.pattern)
-        new_path = d / new_name
-        if new_path != f:
-            planned.append((f, new_path))
+        resolved.append((f, dt))
+
+    planned = plan_renames(resolved, args.pattern)
+
+    if cache:
+        cache.db.commit()
+        print(f"Cache: {cache.hits} hit(s), {cache.misses} file(s) read")
 
     if args.dry_run:
         for src, dst in planned:
@@ -174,17 +784,20 @@ def main():
             print(f"Skipped (no metadata date): {skipped_missing}")
         if skipped_recent:
             print(f"Skipped (within last {args.recent_days} days): {skipped_recent}")
+        if cache:
+            cache.close()
         return
 
-    # Do the rename
+    # Two-phase apply through the journal, so chains/cycles can't clobber files
     count = 0
-    for src, dst in planned:
+    if planned:
         try:
-            src.rename(dst)
-            count += 1
-            print(f"Renamed: {src.name} -> {dst.name}")
+            count = apply_batch(planned, journal, cache)
         except Exception as e:
-            print(f"FAILED: {src} -> {dst}  ({e})", file=sys.stderr)
+            print(f"FAILED: {e}\nJournal kept at {journal}; re-run with --resume or --rollback.",
+                  file=sys.stderr)
+    if cache:
+        cache.close()
     print(f"\nDone. Renamed {count} files out of {len(planned)} planned.")
     if skipped_missing:
         print(f"Skipped (no metadata date): {skipped_missing}")
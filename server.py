@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Local server for the gallery: index.html, foto/, derivatives/, manifest/, atlas/.
+- Only those top-level names of --root are served (--expose to change the list,
+  --expose-all for a build output such as ./dist), so running it from the source
+  tree doesn't publish data/captions.log, the scripts or the entry files.
+- One asyncio event loop; file bodies go out with loop.sendfile(), i.e. os.sendfile
+  zero-copy on Linux, so a month view asking for 40+ big JPEGs at once is served at
+  disk speed instead of parking one thread per request like `python -m http.server`.
+- Strong ETags from size+mtime: If-None-Match -> 304. Single-range Range requests
+  (and If-Range) -> 206; multi-range requests get the whole file.
+- At most --max-connections are served at once, the rest wait in accept order.
+- Precompressed .gz siblings (build_static.py) are sent when the client accepts gzip;
+  content-hashed names get Cache-Control: immutable, everything else no-cache.
+- /api/captions is served from the caption store in --data (see captions.py) and
+  /api/export streams a ZIP of a day/month/sender (see export_zip.py); other scripts
+  mount their endpoints with GalleryServer.route(prefix, handler) (gallery_http.py).
+
+Usage:
+  python3 server.py                     # http://localhost:3000, serves .
+  python3 server.py --root ./dist --expose-all --port 8080 --max-connections 64
+"""
+
+import argparse
+import asyncio
+import signal
+from contextlib import suppress
+from pathlib import Path
+
+from gallery_http import DEFAULT_EXPOSE, DEFAULT_MAX_CONNECTIONS, GalleryServer
+
+DEFAULT_PORT = 3000
+
+async def serve(server: GalleryServer, host: str, port: int):
+    server.slots = asyncio.Semaphore(server.max_connections)
+    srv = await asyncio.start_server(server.handle_connection, host, port, backlog=256)
+    print(f"Serving {server.root} on http://{host}:{port}/ (max {server.max_connections} connections)")
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):  # e.g. Windows
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    async with srv:
+        await stop.wait()
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve the gallery with sendfile, ETag/304 and Range support.")
+    ap.add_argument("--root", default=".", help="Gallery directory (default: .)")
+    ap.add_argument("--expose", nargs="+", default=list(DEFAULT_EXPOSE), metavar="NAME",
+                    help="Top-level files/dirs of --root that are served (default: %(default)s)")
+    ap.add_argument("--expose-all", action="store_true",
+                    help="Serve everything under --root but dot-files (for a build output such as ./dist)")
+    ap.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port (default: %(default)s)")
+    ap.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                    help="Connections served at once; more wait their turn (default: %(default)s)")
+    ap.add_argument("--data", default="./data", help="Caption store directory (default: ./data)")
+    ap.add_argument("--no-api", action="store_true", help="Serve static files only")
+    ap.add_argument("--quiet", action="store_true", help="No access log")
+    args = ap.parse_args()
+
+    root = Path(args.root).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit("Root is not a folder.")
+    server = GalleryServer(root, max(1, args.max_connections), args.quiet, None if args.expose_all else args.expose)
+    store = None
+    if not args.no_api:
+        import captions
+        store = captions.CaptionStore(Path(args.data).expanduser())
+        captions.mount(server, store)
+        import export_zip
+        export_zip.mount(server)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if store:
+            store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Insert entries for NEW photos into an existing page instead of regenerating it.
+- Indexes the srcs already in the target (inside #data for index.html) plus any
+  --known files (default: ./entries), and where each day's section starts; only
+  the sections that get new figures are parsed further.
+- Lists the folder without stat'ing or parsing published files: only new ones
+  are sorted, dated and rendered, so the work follows the number of new photos.
+- Builds <figure> blocks only for files whose src isn't indexed yet, and appends
+  them to the matching day section in the order given (capture order from
+  import_photos.py, natural filename order from this script; new days get a new
+  section next to the closest existing date). Existing figures/figcaptions are untouched.
+- The target is rewritten atomically (temp file + fsync + rename).
+
+Usage:
+  python3 update_entries.py ./foto --target index.html --sender "Gegè 👨🏻" --symbol "👨🏻" --dry-run
+  python3 update_entries.py ./foto --target index.html --sender "Fra 🍐" --symbol "🍐" --only ./foto/2025-10-01.jpg
+"""
+
+import argparse
+import bisect
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import perf
+from gallery_io import DATA_OPEN_RE, FIGURE_RE, IMG_SRC_RE, SECTION_OPEN_RE, SECTION_RE, atomic_write_text
+from image_meta import DEFAULT_CACHE as META_CACHE, MetaCache
+from gallery_entries import DEFAULT_EXTS, DEFAULT_SIZES, build_figure, group_by_day, natural_key
+
+DEFAULT_KNOWN = "entries"  # staging copy of the markup; its srcs count as published
+
+@dataclass
+class Section:
+    day: str
+    start: int            # offset of "<section"
+    end: int              # offset just past "</section>"
+    close: int            # offset of "</section>"
+    figures: List[Tuple[str, int, int]] = field(default_factory=list)  # (src, start, end)
+
+@dataclass
+class Page:
+    text: str
+    data_start: int
+    days: Dict[str, int]  # day -> offset of its (first) <section>
+    published: Set[str]   # normalised srcs of the page and the --known files
+
+def norm_src(src: str) -> str:
+    """'./foto/a.jpg' and 'foto/a.jpg' are the same photo."""
+    return src[2:] if src.startswith("./") else src
+
+def src_key(rel: str, base_url: str) -> str:
+    """Normalised src of a file at <rel> (posix, relative to the folder)."""
+    return norm_src(f"{base_url.rstrip('/')}/{rel}" if base_url else rel)
+
+def data_span(text: str) -> Tuple[int, int]:
+    """Where to look for sections: after <div id="data"> if present, else the whole file."""
+    m = DATA_OPEN_RE.search(text)
+    return (m.end(), len(text)) if m else (0, len(text))
+
+def page_srcs(text: str, start: int = 0, end: Optional[int] = None) -> Set[str]:
+    return {norm_src(m.group(1)) for m in IMG_SRC_RE.finditer(text, start, len(text) if end is None else end)}
+
+def section_at(text: str, pos: int) -> Section:
+    """The section whose tag opens at pos, with its figures."""
+    m = SECTION_RE.match(text, pos)
+    if m is None:
+        raise ValueError(f"unclosed <section> at offset {pos}")
+    sec = Section(m.group(1), m.start(), m.end(), m.end() - len("</section>"))
+    for fm in FIGURE_RE.finditer(text, m.start(2), m.end(2)):
+        im = IMG_SRC_RE.search(fm.group(0))
+        if im:
+            sec.figures.append((norm_src(im.group(1)), fm.start(), fm.end()))
+    return sec
+
+@perf.timed("load_page")
+def load_page(target: Path, known_files: Iterable[str] = ()) -> Page:
+    """
+    What's published and where each day starts: one pass over the section tags and
+    one over the <img> srcs. Sections are only parsed when a figure goes into them.
+    """
+    text = target.read_text(encoding="utf-8")
+    data_start, data_end = data_span(text)
+    days: Dict[str, int] = {}
+    for m in SECTION_OPEN_RE.finditer(text, data_start, data_end):
+        days.setdefault(m.group(1), m.start())
+    published = page_srcs(text, data_start, data_end)
+    for k in known_files:
+        published |= page_srcs(Path(k).read_text(encoding="utf-8"))
+    return Page(text, data_start, days, published)
+
+def default_known() -> List[str]:
+    """--known when not given: ./entries if there is one, for every script that splices."""
+    return [DEFAULT_KNOWN] if Path(DEFAULT_KNOWN).is_file() else []
+
+@perf.timed("unpublished_files")
+def unpublished_files(root: Path, recursive: bool, exts: List[str], base_url: str,
+                      published: Set[str]) -> List[Path]:
+    """
+    Images under root whose src isn't published yet, in collect_files() order.
+    Listed with scandir (no stat per file); only the new ones are sorted and parsed.
+    """
+    extset = {"." + e.lower().lstrip(".") for e in exts} if exts else set(DEFAULT_EXTS)
+    found = []
+    todo = [("", str(root))]
+    while todo:
+        prefix, d = todo.pop()
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir():
+                    if recursive:
+                        todo.append((f"{prefix}{e.name}/", e.path))
+                elif e.is_file() and os.path.splitext(e.name)[1].lower() in extset:
+                    rel = prefix + e.name
+                    if src_key(rel, base_url) not in published:
+                        found.append((natural_key(rel), e.path))
+    found.sort()
+    return [Path(path) for _, path in found]
+
+def line_indent(text: str, pos: int) -> str:
+    """Leading whitespace of the line containing pos."""
+    line_start = text.rfind("\n", 0, pos) + 1
+    m = re.match(r"[ \t]*", text[line_start:pos])
+    return m.group(0) if m else ""
+
+def render(lines: List[str], indent: str) -> str:
+    return "\n".join(indent + line for line in lines)
+
+def plan_insertions(page: Page, new: Dict[str, List[Tuple[str, List[str]]]]) -> List[Tuple[int, str]]:
+    """
+    (offset, text) edits for new figures. `new` maps day -> [(src, figure_lines)].
+    Only the touched sections are inspected, so cost follows the number of new photos.
+    """
+    text = page.text
+    days_sorted = sorted(page.days)
+    edits: List[Tuple[int, str]] = []
+
+    # New days sharing an anchor are inserted at the same offset: keep them in date order
+    for day in sorted(new):
+        figs = new[day]
+        if day in page.days:
+            sec = section_at(text, page.days[day])
+            # After the day's last figure, in the given order: filenames don't tell capture
+            # order apart (2024-04-25.jpg vs 2024-04-25_153012.jpg), the caller does
+            sec_indent = line_indent(text, sec.start)
+            fig_indent = line_indent(text, sec.figures[0][1]) if sec.figures else sec_indent + "  "
+            pos = sec.figures[-1][2] if sec.figures else text.rfind(">", sec.start, sec.close) + 1
+            for _src, lines in figs:
+                edits.append((pos, "\n" + render(lines, fig_indent)))
+            continue
+
+        # New day: next to the nearest existing date so local order stays sorted
+        i = bisect.bisect_left(days_sorted, day)
+        if i > 0:
+            anchor = section_at(text, page.days[days_sorted[i - 1]])
+            sec_indent = line_indent(text, anchor.start)
+            pos, lead, tail = anchor.end, "\n\n" + sec_indent, ""
+        elif days_sorted:
+            anchor = section_at(text, page.days[days_sorted[0]])
+            sec_indent = line_indent(text, anchor.start)
+            pos, lead, tail = anchor.start, "", "\n\n" + sec_indent
+        else:
+            sec_indent = line_indent(text, page.data_start) + "  "
+            pos, lead, tail = page.data_start, "\n" + sec_indent, ""
+        block = [f'<section data-date="{day}">']
+        for _src, lines in figs:
+            block.extend("  " + line for line in lines)
+        block.append("</section>")
+        body = render(block, sec_indent)[len(sec_indent):]
+        edits.append((pos, lead + body + tail))
+    return edits
+
+def apply_edits(text: str, edits: List[Tuple[int, str]]) -> str:
+    # Stable by offset so two inserts at the same spot keep their planned order
+    out, last = [], 0
+    for pos, chunk in sorted(edits, key=lambda e: e[0]):
+        out.append(text[last:pos])
+        out.append(chunk)
+        last = pos
+    out.append(text[last:])
+    return "".join(out)
+
+def update_target(target: Path, groups: Dict[str, List[Path]], root: Path, base_url: str,
+                  sender: str, symbol: str, known_files: Iterable[str] = (),
+                  derivatives: Optional[Path] = None, derivatives_url: str = "",
+                  sizes: str = DEFAULT_SIZES, dry: bool = False,
+                  meta: Optional[MetaCache] = None, page: Optional[Page] = None) -> Dict[str, List[str]]:
+    """
+    Splice figures for the not-yet-published files of day -> [paths] into target.
+    Returns day -> [new srcs] (what was, or with dry=True would be, added).
+    Pass `page` when it was already loaded (with the same known_files).
+    """
+    page = page or load_page(target, known_files)
+    published = set(page.published)
+
+    new: Dict[str, List[Tuple[str, List[str]]]] = defaultdict(list)
+    for day, paths in groups.items():
+        for p in paths:
+            src = src_key(p.relative_to(root).as_posix(), base_url)
+            if src in published:
+                continue
+            published.add(src)
+            lines = build_figure(p, day, base_url, root, sender, symbol, derivatives, derivatives_url, sizes, meta)
+            new[day].append((src, lines))
+
+    if new and not dry:
+        atomic_write_text(target, apply_edits(page.text, plan_insertions(page, new)))
+    return {day: [src for src, _ in figs] for day, figs in new.items()}
+
+def main():
+    ap = argparse.ArgumentParser(description="Insert entries for new photos into an existing page.")
+    ap.add_argument("folder", help="Folder with images (e.g. ./foto)")
+    ap.add_argument("--target", default="index.html", help="File to update in place (default: index.html)")
+    ap.add_argument("--known", action="append",
+                    help="Other files whose srcs count as already published (repeatable, default: ./entries)")
+    ap.add_argument("--only", action="append", help="Consider only these files instead of listing the folder")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Scan subfolders too")
+    ap.add_argument("--ext", action="append", help="Extra extension(s) to include (repeatable)")
+    ap.add_argument("--base-url", default="./foto", help="Prefix for image src (default: ./foto)")
+    ap.add_argument("--sender", required=True, help="data-sender value for new figures")
+    ap.add_argument("--symbol", required=True, help="data-symbol value for new figures")
+    ap.add_argument("--derivatives", default="", help="Derivative dir from make_derivatives.py")
+    ap.add_argument("--derivatives-url", default="./derivatives", help="Prefix for derivative URLs in srcset")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="sizes attribute for srcset")
+    ap.add_argument("--no-meta", action="store_true", help="Don't emit width/height and placeholder attributes")
+    ap.add_argument("--meta-cache", default=str(META_CACHE), help="Image size/placeholder cache (default: %(default)s)")
+    ap.add_argument("--dry-run", action="store_true", help="Print the new figures, don't write")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        raise SystemExit("Path is not a folder.")
+    target = Path(args.target).expanduser()
+    if not target.is_file():
+        raise SystemExit(f"Target not found: {target}")
+
+    known_files = args.known if args.known is not None else default_known()
+    page = load_page(target, known_files)
+
+    if args.only:
+        files = []
+        for p in args.only:
+            f = Path(p).expanduser().resolve()
+            if root not in f.parents:
+                raise SystemExit(f"--only {p} is not inside {args.folder}")
+            if not f.is_file():
+                raise SystemExit(f"--only {p}: no such file")
+            files.append(f)
+    else:
+        exts = list(DEFAULT_EXTS) + ["." + e.lower().lstrip(".") for e in (args.ext or [])]
+        files = unpublished_files(root, args.recursive, exts, args.base_url, page.published)
+    groups, skipped = group_by_day(files)
+
+    derivatives = Path(args.derivatives).expanduser().resolve() if args.derivatives else None
+    meta = None if args.no_meta else MetaCache(Path(args.meta_cache).expanduser())
+    added = update_target(target, groups, root, args.base_url, args.sender, args.symbol, known_files,
+                          derivatives, args.derivatives_url, args.sizes, args.dry_run, meta, page)
+    if meta:
+        meta.close()
+
+    count = sum(len(v) for v in added.values())
+    if not count:
+        print(f"Nothing new for {target}.")
+        return
+
+    if args.dry_run:
+        for day in sorted(added):
+            for src in added[day]:
+                print(f"[DRY] {day}  +{src}")
+    print(f"\n{'Would add' if args.dry_run else 'Added'} {count} figure(s) on {len(added)} day(s) to {target}.")
+    if skipped:
+        print(f"Skipped {len(skipped)} non-matching file(s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Watch a folder and ingest only what changes: capture-date rename, HEIC conversion,
+derivatives and entry insertion for the new files, instead of re-running every
+script over the whole library.
+- Linux inotify (via ctypes, no extra packages); anything else, or --poll, falls
+  back to rescanning with rename_script.iter_files() every --interval seconds.
+- A file is picked up once its size/mtime have stayed put for --settle seconds, so
+  half-copied files (AirDrop, rsync, Finder) are never read.
+- Dates and renames happen on the watching thread; conversion/derivatives run on a
+  pool of --jobs workers fed through a bounded queue of --queue items. A full queue
+  slows the watcher down instead of growing memory; if the kernel event queue
+  overflows meanwhile, the folder is rescanned.
+- Every file is handled once per (size, mtime); the files this script writes itself
+  (renamed names, converted JPEGs) are recorded too, so they don't come back in.
+- New figures are spliced into --target (or merged into --manifest) in batches every
+  --flush seconds.
+
+Usage:
+  python3 watch_photos.py ./foto --sender "Fra 🍐" --symbol "🍐" --srgb --target index.html
+  python3 watch_photos.py ./foto -r --sender "Gegè 👨🏻" --symbol "👨🏻" --manifest ./manifest --poll
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import heic_convert
+import gallery_entries as entries
+import make_derivatives
+import perf
+import rename_script
+from image_meta import DEFAULT_CACHE as META_CACHE, MetaCache
+from import_photos import HEIC_EXTS, Renamer, group_by_capture_day, process_media
+from manifest import write_manifest
+from update_entries import default_known, update_target
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+def interesting(p: Path) -> bool:
+    return p.suffix.lower() in rename_script.VALID_EXTS and not p.name.startswith(".")
+
+def stat_key(p: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+class InotifyWatcher:
+    """Paths touched under root, straight from the kernel. Raises OSError where unavailable."""
+
+    def __init__(self, root: Path, recursive: bool):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self.recursive = recursive
+        self.dirs: Dict[int, Path] = {}
+        self.overflowed = False
+        self.add_tree(root)
+
+    def add_tree(self, d: Path) -> List[Path]:
+        """Watch d (and subdirs if recursive); returns files already inside, they may predate the watch."""
+        found = []
+        dirs = [d]
+        while dirs:
+            cur = dirs.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(cur), WATCH_MASK)
+            if wd < 0:
+                continue
+            self.dirs[wd] = cur
+            for entry in os.scandir(cur):
+                if entry.is_dir() and self.recursive:
+                    dirs.append(Path(entry.path))
+                elif entry.is_file():
+                    found.append(Path(entry.path))
+        return found
+
+    def poll(self, timeout: float) -> Iterator[Path]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        off = 0
+        while off + EVENT.size <= len(data):
+            wd, mask, _cookie, length = EVENT.unpack_from(data, off)
+            name = data[off + EVENT.size:off + EVENT.size + length].rstrip(b"\0")
+            off += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            base = self.dirs.get(wd)
+            if base is None or not name:
+                continue
+            p = base / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    yield from self.add_tree(p)
+                continue
+            yield p
+
+    def close(self):
+        os.close(self.fd)
+
+class PollWatcher:
+    """Fallback: rescan every interval and report files whose size/mtime changed."""
+
+    def __init__(self, root: Path, recursive: bool, interval: float):
+        self.root = root
+        self.recursive = recursive
+        self.interval = interval
+        self.known = {p: stat_key(p) for p in rename_script.iter_files(root, recursive)}
+        self.next_scan = time.monotonic() + interval
+        self.overflowed = False
+
+    def poll(self, timeout: float) -> Iterator[Path]:
+        wait = self.next_scan - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            return
+        self.next_scan = time.monotonic() + self.interval
+        current = {}
+        for p in rename_script.iter_files(self.root, self.recursive):
+            current[p] = stat_key(p)
+            if self.known.get(p) != current[p]:
+                yield p
+        self.known = current
+
+    def close(self):
+        pass
+
+class Debouncer:
+    """Hold paths until their size/mtime have been stable for `settle` seconds."""
+
+    def __init__(self, settle: float):
+        self.settle = settle
+        self.waiting: Dict[Path, Tuple[float, Optional[Tuple[int, int]]]] = {}
+
+    def touch(self, p: Path):
+        self.waiting[p] = (time.monotonic(), stat_key(p))
+
+    def ready(self) -> List[Path]:
+        now = time.monotonic()
+        out = []
+        for p, (t, key) in list(self.waiting.items()):
+            if now - t < self.settle:
+                continue
+            cur = stat_key(p)
+            if cur is None:
+                del self.waiting[p]  # deleted or renamed away before it settled
+            elif cur != key:
+                self.waiting[p] = (now, cur)  # still being written
+            else:
+                del self.waiting[p]
+                out.append(p)
+        return sorted(out)
+
+def main():
+    ap = argparse.ArgumentParser(description="Watch a folder and ingest new photos incrementally.")
+    ap.add_argument("folder", help="Folder to watch (e.g. ./foto)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="Watch subfolders too")
+    ap.add_argument("--poll", action="store_true", help="Rescan periodically instead of using inotify")
+    ap.add_argument("--interval", type=float, default=2.0, help="Rescan interval with --poll (default: 2s)")
+    ap.add_argument("--settle", type=float, default=2.0, help="Seconds a file must stay unchanged (default: 2)")
+    ap.add_argument("--initial-scan", action="store_true", help="Also ingest the files already in the folder")
+    ap.add_argument("-j", "--jobs", type=int, default=0, help="Conversion workers (default: all cores)")
+    ap.add_argument("--queue", type=int, default=64, help="Max files waiting for a worker (default: 64)")
+    ap.add_argument("--flush", type=float, default=5.0, help="Seconds between entry insertions (default: 5)")
+    # rename_script.py
+    ap.add_argument("--pattern", default="%Y-%m-%d_%H%M%S", help="strftime pattern for filename stem (default: %(default)s)")
+    ap.add_argument("--recent-days", type=int, default=rename_script.DEFAULT_RECENT_DAYS,
+                    help="Don't rename files whose metadata date is within the last N days (default: %(default)s; 0 disables)")
+    ap.add_argument("--allow-mtime", action="store_true", help="Fall back to file mtime when no metadata date is available")
+    ap.add_argument("--no-exiftool", action="store_true", help="Use only the built-in EXIF/QuickTime reader")
+    ap.add_argument("--cache", default=str(rename_script.DEFAULT_CACHE), help="Capture-date cache (default: %(default)s)")
+    ap.add_argument("--no-cache", action="store_true", help="Don't use the capture-date cache")
+    # heic_convert.py / make_derivatives.py
+    ap.add_argument("--quality", type=int, default=92, help="JPEG quality for converted HEIC (default: 92)")
+    ap.add_argument("--srgb", action="store_true", help="Convert colors to sRGB for maximum compatibility")
+    ap.add_argument("--delete-original", action="store_true", help="Delete .HEIC after successful conversion")
+    ap.add_argument("--derivatives", default="", help="Also write width variants here (see make_derivatives.py)")
+    ap.add_argument("--derivatives-url", default="./derivatives", help="Prefix for derivative URLs in srcset")
+    # entries
+    ap.add_argument("--base-url", default="./foto", help="Prefix for image src (default: ./foto)")
+    ap.add_argument("--sender", required=True, help="data-sender value")
+    ap.add_argument("--symbol", required=True, help="data-symbol value")
+    ap.add_argument("--target", default="index.html", help="Page to splice new figures into (default: index.html)")
+    ap.add_argument("--known", action="append",
+                    help="Other files whose srcs count as already published (repeatable, default: ./entries)")
+    ap.add_argument("--manifest", default="", help="Merge new entries into this manifest dir instead of --target")
+    ap.add_argument("--no-meta", action="store_true", help="Don't emit width/height and placeholder attributes")
+    ap.add_argument("--meta-cache", default=str(META_CACHE), help="Image size/placeholder cache (default: %(default)s)")
+    ap.add_argument("--perf", default="", metavar="FILE",
+                    help="Time each stage; write a JSON report here (\"1\": summary only). Env: PICCOLAMIMI_PERF")
+    args = ap.parse_args()
+    perf.setup(args.perf)
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        sys.exit("Path is not a folder.")
+    target = Path(args.target).expanduser()
+    known_files = args.known if args.known is not None else default_known()
+    if not args.manifest and not target.is_file():
+        sys.exit(f"Target not found: {target}")
+    use_exiftool = not args.no_exiftool
+    if use_exiftool:
+        rename_script.ensure_exiftool()
+
+    watcher = None
+    if not args.poll:
+        try:
+            watcher = InotifyWatcher(root, args.recursive)
+        except (OSError, AttributeError) as e:  # AttributeError: libc without inotify (macOS)
+            print(f"inotify unavailable ({e}); polling every {args.interval}s", file=sys.stderr)
+    if watcher is None:
+        watcher = PollWatcher(root, args.recursive, args.interval)
+
+    cache = None if args.no_cache else rename_script.DateCache(Path(args.cache).expanduser())
+    meta = None if args.no_meta else MetaCache(Path(args.meta_cache).expanduser())
+    spec = heic_convert.OutputSpec("jpg", args.quality, None)
+    derivatives = Path(args.derivatives).expanduser().resolve() if args.derivatives else None
+    widths = list(make_derivatives.DEFAULT_WIDTHS)
+    renamer = Renamer(args.pattern, False, cache)
+    debounce = Debouncer(args.settle)
+    done: Dict[Path, Tuple[int, int]] = {}  # path -> (size, mtime) when last handled
+    images: List[tuple] = []                # (path, capture dt) waiting for the next flush
+    dates: Dict[Path, Optional[datetime]] = {}
+    inflight = set()                        # outputs a worker is writing right now
+
+    work: "queue.Queue" = queue.Queue(maxsize=max(1, args.queue))
+    results: "queue.Queue" = queue.Queue()
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            results.put((item, process_media(item, spec, args.srgb, root, derivatives, widths, False)))
+
+    workers = [threading.Thread(target=worker, daemon=True)
+               for _ in range(args.jobs if args.jobs > 0 else (os.cpu_count() or 1))]
+    for t in workers:
+        t.start()
+
+    def wanted(p: Path) -> bool:
+        return interesting(p) and not (derivatives and derivatives in p.parents)
+
+    def mark(p: Path):
+        key = stat_key(p)
+        if key:
+            done[p] = key
+        renamer.reserve(p)
+
+    def ingest(p: Path):
+        key = stat_key(p)
+        if key is None or done.get(p) == key or p in inflight:
+            return
+        if cache:
+            dt, _tag = cache.get(p, use_exiftool)
+        else:
+            dt, _tag = rename_script.get_capture_dt(p, use_exiftool)
+        if dt is None and args.allow_mtime:
+            dt = datetime.fromtimestamp(p.stat().st_mtime)
+        renamer.reserve(p)
+        now = datetime.now()
+        if dt is not None and not (args.recent_days > 0 and now - timedelta(days=args.recent_days) <= dt <= now):
+            try:
+                p = renamer(p, dt)
+            except Exception as e:
+                print(f"FAILED: {p}  ({e})", file=sys.stderr)
+        mark(p)
+        ext = p.suffix.lower()
+        if ext in HEIC_EXTS or (derivatives and ext in make_derivatives.DEFAULT_EXTS):
+            dates[p] = dt
+            if ext in HEIC_EXTS:
+                out = p.with_name(heic_convert.output_name(p.stem, spec))
+                inflight.add(out)
+                renamer.reserve(out)
+            work.put(p)  # blocks while the workers are behind
+        elif ext in entries.DEFAULT_EXTS:
+            images.append((p, dt))
+
+    def collect():
+        while True:
+            try:
+                src, res = results.get_nowait()
+            except queue.Empty:
+                return
+            for msg in res["msgs"]:
+                print(msg)
+            image = Path(res["image"])
+            inflight.discard(image)
+            mark(image)
+            if res["converted"] and args.delete_original:
+                try:
+                    os.remove(src)
+                    done.pop(src, None)
+                    print(f"Deleted original: {src}")
+                except Exception as e:
+                    print(f"Failed to delete {src}: {e}")
+            if image.suffix.lower() in entries.DEFAULT_EXTS:
+                images.append((image, dates.pop(src, None)))
+
+    def flush():
+        groups = group_by_capture_day(images)
+        images.clear()
+        if not groups:
+            return
+        if args.manifest:
+            days = entries.build_manifest(groups, args.base_url, root, args.sender, args.symbol,
+                                          derivatives=derivatives, derivatives_url=args.derivatives_url, meta=meta)
+            written = write_manifest(Path(args.manifest).expanduser(), days)
+            print(f"Manifest: {len(written)} month shard(s) updated")
+        else:
+            added = update_target(target, groups, root, args.base_url, args.sender, args.symbol,
+                                  known_files, derivatives=derivatives, derivatives_url=args.derivatives_url,
+                                  meta=meta)
+            if added:
+                print(f"Added {sum(map(len, added.values()))} figure(s) to {target}")
+        if meta:
+            meta.db.commit()
+        if cache:
+            cache.db.commit()
+
+    if args.initial_scan:
+        for p in sorted(rename_script.iter_files(root, args.recursive)):
+            debounce.touch(p)
+    else:
+        for p in rename_script.iter_files(root, args.recursive):
+            mark(p)
+
+    def on_term(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_term)  # stop the same way under systemd/launchd
+
+    print(f"Watching {root} ({type(watcher).__name__}, {len(workers)} worker(s)). Ctrl-C to stop.")
+    last_flush = time.monotonic()
+    try:
+        while True:
+            for p in watcher.poll(min(0.5, args.settle)):
+                if wanted(p):
+                    debounce.touch(p)
+            if watcher.overflowed:
+                print("Event queue overflowed; rescanning.", file=sys.stderr)
+                watcher.overflowed = False
+                for p in rename_script.iter_files(root, args.recursive):
+                    if wanted(p) and done.get(p) != stat_key(p):
+                        debounce.touch(p)
+            for p in debounce.ready():
+                ingest(p)
+                collect()
+            collect()
+            idle = work.empty() and not debounce.waiting
+            if images and (idle or time.monotonic() - last_flush >= args.flush):
+                flush()
+                last_flush = time.monotonic()
+    except KeyboardInterrupt:
+        print("\nStopping: finishing queued files...")
+    finally:
+        for _ in workers:
+            work.put(None)
+        for t in workers:
+            t.join()
+        collect()
+        flush()
+        watcher.close()
+        if cache:
+            cache.close()
+        if meta:
+            meta.close()
+
+if __name__ == "__main__":
+    main()